@@ -0,0 +1,38 @@
+-- Migration 005: Insert steps and their screenshots in one round-trip
+-- Description: insert_step_batch() writes a batch of task_steps rows and the
+-- step_screenshots rows that reference them in a single transaction, so the
+-- background step writer needs one RPC call per flush instead of two inserts
+
+CREATE OR REPLACE FUNCTION insert_step_batch(steps JSONB, screenshots JSONB)
+RETURNS VOID
+LANGUAGE plpgsql
+-- Runs with the caller's rights (the writer already has INSERT on both tables);
+-- search_path is pinned so unqualified names cannot resolve to another schema
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+    -- Steps first so the step_screenshots.step_id foreign keys resolve
+    INSERT INTO task_steps (
+        id, task_id, step_number, step_type, step_data, thinking, action_result,
+        screenshot_path, screenshot_url, duration_ms, success, error_message, created_at
+    )
+    SELECT
+        COALESCE(s.id, gen_random_uuid()), s.task_id, s.step_number, s.step_type,
+        s.step_data, s.thinking, s.action_result, s.screenshot_path, s.screenshot_url,
+        s.duration_ms, COALESCE(s.success, true), s.error_message,
+        COALESCE(s.created_at, NOW())
+    FROM jsonb_populate_recordset(NULL::task_steps, COALESCE(steps, '[]'::JSONB)) AS s;
+
+    INSERT INTO step_screenshots (
+        id, task_id, step_id, screenshot_path, remote_url, file_size, file_hash,
+        compressed, metadata, created_at
+    )
+    SELECT
+        COALESCE(c.id, gen_random_uuid()), c.task_id, c.step_id, c.screenshot_path,
+        c.remote_url, c.file_size, c.file_hash, COALESCE(c.compressed, false),
+        c.metadata, COALESCE(c.created_at, NOW())
+    FROM jsonb_populate_recordset(NULL::step_screenshots, COALESCE(screenshots, '[]'::JSONB)) AS c;
+END;
+$$;
+
+COMMENT ON FUNCTION insert_step_batch(JSONB, JSONB) IS 'Insert task_steps and step_screenshots rows in one transaction';
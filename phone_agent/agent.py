@@ -1,6 +1,7 @@
 """Main PhoneAgent class for orchestrating phone automation."""
 
 import base64
+import hashlib
 import json
 import logging
 import traceback
@@ -34,16 +35,22 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
-def _save_screenshot_to_file(screenshot: Screenshot, save_dir: Path) -> Optional[str]:
+def _save_screenshot_to_file(
+    screenshot: Screenshot, save_dir: Path
+) -> Optional[tuple[str, int, str]]:
     """
-    Save screenshot to file and return filename.
+    Save screenshot to file and return filename, size and hash.
+
+    The size and SHA256 are taken from the decoded bytes while they are in
+    memory, so consumers never need to re-read the file.
 
     Args:
         screenshot: Screenshot object with base64_data
         save_dir: Directory to save screenshot files
 
     Returns:
-        filename (e.g. 'screenshot_20251213_221530_a1b2c3d4.png') or None if failed
+        (filename, size in bytes, SHA256 hex digest), e.g.
+        ('screenshot_20251213_221530_a1b2c3d4.png', 183214, '9f86d0...'), or None if failed
     """
     if not screenshot or not screenshot.base64_data:
         return None
@@ -63,7 +70,8 @@ def _save_screenshot_to_file(screenshot: Screenshot, save_dir: Path) -> Optional
         filepath.write_bytes(image_data)
 
         logger.debug(f"Screenshot saved: {filename} ({len(image_data)} bytes)")
-        return filename
+        file_hash = hashlib.sha256(image_data, usedforsecurity=False).hexdigest()
+        return filename, len(image_data), file_hash
     except OSError as e:
         if hasattr(e, 'errno'):
             import errno
@@ -456,12 +464,15 @@ class PhoneAgent:
             # Save screenshot to file
             screenshot_filename = None
             screenshot_path = None
+            screenshot_size = None
+            screenshot_hash = None
             if screenshot and screenshot.base64_data:
                 # Determine screenshots directory (relative to web/static/screenshots)
                 # Navigate from phone_agent/ to web/static/screenshots/
                 screenshots_dir = Path(__file__).parent.parent / 'web' / 'static' / 'screenshots'
-                screenshot_filename = _save_screenshot_to_file(screenshot, screenshots_dir)
-                if screenshot_filename:
+                saved = _save_screenshot_to_file(screenshot, screenshots_dir)
+                if saved:
+                    screenshot_filename, screenshot_size, screenshot_hash = saved
                     screenshot_path = str(screenshots_dir / screenshot_filename)
 
             # Record step in StepTracker if available
@@ -490,6 +501,8 @@ class PhoneAgent:
                 'result': result,
                 'screenshot': screenshot_filename,  # Send filename instead of base64 data
                 'screenshot_path': screenshot_path,  # Full path for database
+                'screenshot_size': screenshot_size,
+                'screenshot_hash': screenshot_hash,
                 'success': result.success,
                 'finished': finished
             }
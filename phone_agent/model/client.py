@@ -1,5 +1,7 @@
 """Model client for AI inference using OpenAI-compatible API."""
 
+from __future__ import annotations
+
 import json
 import time
 from dataclasses import dataclass, field
@@ -10,11 +10,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-# 尝试导入脚本管理器（如果在web环境中）
+# 尝试导入脚本管理器（如果在web环境中）；与web/app.py使用同一导入路径，
+# 保证进程内只有一份web.script_manager模块及其共享实例
 try:
-    import sys
-    sys.path.append(str(Path(__file__).parent.parent / 'web'))
-    from script_manager import ScriptManager, ScriptRecord
+    from web.script_manager import ScriptRecord, get_script_manager
     SCRIPT_MANAGER_AVAILABLE = True
 except ImportError:
     SCRIPT_MANAGER_AVAILABLE = False
@@ -84,7 +83,7 @@ class ScriptRecorder:
         self.script_manager = None
         if save_to_db and SCRIPT_MANAGER_AVAILABLE:
             try:
-                self.script_manager = ScriptManager()
+                self.script_manager = get_script_manager()
             except Exception as e:
                 print(f"警告: 无法初始化脚本管理器，将只保存到本地文件: {e}")
                 self.save_to_db = False
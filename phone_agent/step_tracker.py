@@ -311,14 +311,13 @@ class StepTracker:
     def _record_screenshot(self, screenshot_path: str, task_id: Optional[str] = None, step_id: Optional[str] = None):
         """Record screenshot information and trigger upload"""
         try:
-            if not os.path.exists(screenshot_path):
+            # Get file info (a single stat doubles as the existence check)
+            try:
+                file_size = os.stat(screenshot_path).st_size
+            except FileNotFoundError:
                 logger.warning(f"Screenshot file not found: {screenshot_path}")
                 return
 
-            # Get file info
-            stat = os.stat(screenshot_path)
-            file_size = stat.st_size
-
             # Calculate file hash
             file_hash = self._calculate_file_hash(screenshot_path)
 
@@ -363,11 +362,13 @@ class StepTracker:
     def _calculate_file_hash(self, file_path: str) -> str:
         """Calculate SHA256 hash of a file"""
         try:
-            sha256 = hashlib.sha256()
             with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
+                if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                    return hashlib.file_digest(f, 'sha256').hexdigest()
+                sha256 = hashlib.sha256()
+                for chunk in iter(lambda: f.read(1 << 20), b''):
                     sha256.update(chunk)
-            return sha256.hexdigest()
+                return sha256.hexdigest()
         except Exception as e:
             logger.error(f"Failed to calculate file hash: {e}")
             return ""
@@ -0,0 +1,233 @@
+"""Shared fixtures for the web tests.
+
+The web modules talk to Supabase through ``create_client``; the tests swap in
+``FakeSupabaseClient``, a small in-memory table store, so no network access
+or Supabase project is needed. When supabase-py itself is not installed a
+placeholder ``supabase`` module is registered so the web modules can be
+imported at all.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Must be set before web.supabase_manager is imported (it reads them at import time)
+os.environ['SUPABASE_URL'] = 'http://supabase.test'
+os.environ['SUPABASE_SECRET_KEY'] = 'test-key'
+os.environ.setdefault('FLASK_SECRET_KEY', 'test-secret')
+os.environ.setdefault('CONVERSATION_LOG_DIR', tempfile.mkdtemp(prefix='pa-conversations-'))
+
+
+class FakeAPIError(Exception):
+    """Stand-in for postgrest's APIError (exposes the PostgREST error code)"""
+
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeResult:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Chainable query builder covering the calls the managers make"""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.op = 'select'
+        self.payload = None
+        self.filters = []
+        self.count = None
+        self.head = False
+        self._limit = None
+
+    def select(self, *columns, count=None, head=False, **kwargs):
+        self.count = count
+        self.head = head
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.op = 'insert'
+        self.payload = rows
+        return self
+
+    upsert = insert
+
+    def update(self, data, **kwargs):
+        self.op = 'update'
+        self.payload = data
+        return self
+
+    def delete(self, **kwargs):
+        self.op = 'delete'
+        return self
+
+    def _filter(self, column, value, compare):
+        def matches(row):
+            try:
+                return compare(row.get(column), value)
+            except TypeError:
+                return False
+        self.filters.append(matches)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, value, lambda a, b: a == b)
+
+    def neq(self, column, value):
+        return self._filter(column, value, lambda a, b: a != b)
+
+    def gte(self, column, value):
+        return self._filter(column, value, lambda a, b: a >= b)
+
+    def lt(self, column, value):
+        return self._filter(column, value, lambda a, b: a < b)
+
+    def in_(self, column, values):
+        return self._filter(column, values, lambda a, b: a in b)
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def __getattr__(self, name):
+        # order(), range(), or_() ... are accepted and ignored
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        if self.client.fail_tables.get(self.table):
+            raise FakeAPIError(self.client.fail_tables[self.table])
+        rows = self.client.tables.setdefault(self.table, [])
+        self.client.calls.append((self.op, self.table))
+        if self.op == 'insert':
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            rows.extend(dict(row) for row in new_rows)
+            return FakeResult([dict(row) for row in new_rows])
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.op == 'update':
+            for row in matched:
+                row.update(self.payload)
+            return FakeResult([dict(row) for row in matched])
+        if self.op == 'delete':
+            self.client.tables[self.table] = [row for row in rows if row not in matched]
+            return FakeResult([dict(row) for row in matched])
+        data = [] if self.head else [dict(row) for row in matched[:self._limit]]
+        return FakeResult(data, len(matched) if self.count else None)
+
+
+class FakeRPC:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.client.calls.append(('rpc', self.name))
+        handler = self.client.rpc_handlers.get(self.name)
+        if handler is None:
+            raise FakeAPIError(f'Could not find the function public.{self.name}', code='PGRST202')
+        return FakeResult(handler(self.client, self.params))
+
+
+class FakeSupabaseClient:
+    """In-memory replacement for supabase.Client"""
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = []
+        # rpc name -> handler(client, params); unknown functions raise PGRST202
+        self.rpc_handlers = {}
+        # table -> error message raised on every query against it
+        self.fail_tables = {}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRPC(self, name, params or {})
+
+
+if importlib.util.find_spec('supabase') is None:
+    _placeholder = types.ModuleType('supabase')
+    _placeholder.Client = FakeSupabaseClient
+    _placeholder.create_client = lambda url, key, options=None: FakeSupabaseClient()
+    sys.modules['supabase'] = _placeholder
+
+# Never reach a real project from the tests, even when supabase-py is installed
+from web import supabase_manager  # noqa: E402
+
+supabase_manager.create_client = lambda url, key, options=None: FakeSupabaseClient()
+
+
+@pytest.fixture
+def fake_client():
+    return FakeSupabaseClient()
+
+
+@pytest.fixture
+def api_error():
+    """Exception class raised by the fake client, for handlers that simulate PostgREST errors"""
+    return FakeAPIError
+
+
+@pytest.fixture
+def insert_step_batch_rpc():
+    """RPC handler emulating migration 005: steps first, then screenshots"""
+    def handler(client, params):
+        client.tables.setdefault('task_steps', []).extend(params['steps'])
+        client.tables.setdefault('step_screenshots', []).extend(params['screenshots'])
+        return None
+    return handler
+
+
+@pytest.fixture(scope='session')
+def web_app_module():
+    """web.app imported once (it builds its task manager at import time)"""
+    from web import app
+    return app
+
+
+@pytest.fixture
+def local_manager(tmp_path):
+    from web.app import LocalTaskManager
+    manager = LocalTaskManager(storage_file=str(tmp_path / 'tasks.db'),
+                               legacy_storage_file=str(tmp_path / 'tasks.pkl'))
+    yield manager
+    manager.flush()
+
+
+@pytest.fixture
+def supabase_task_manager(monkeypatch, fake_client):
+    monkeypatch.setattr(supabase_manager, 'get_supabase_client', lambda purpose='read': fake_client)
+    return supabase_manager.SupabaseTaskManager()
+
+
+@pytest.fixture(params=['local', 'supabase'])
+def task_manager(request, web_app_module, monkeypatch):
+    """Each backend the routes can run on, installed as the app's global task manager"""
+    manager = request.getfixturevalue(
+        'local_manager' if request.param == 'local' else 'supabase_task_manager'
+    )
+    monkeypatch.setattr(web_app_module, 'global_task_manager', manager)
+    return manager
+
+
+@pytest.fixture
+def web(web_app_module, monkeypatch):
+    monkeypatch.setenv('AGENT_MAX_CONCURRENT_TASKS', '1')
+    instance = web_app_module.PhoneAgentWeb()
+    yield instance
+    instance.shutdown()
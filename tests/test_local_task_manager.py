@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试 LocalTaskManager 的后台写入（退出时flush不丢失写入线程正在等待的操作）
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def slow_writer(monkeypatch):
+    """拉长合并窗口：写入线程被唤醒后长时间停在等待中"""
+    from web.app import LocalTaskManager
+
+    monkeypatch.setattr(LocalTaskManager, 'FLUSH_INTERVAL', 5.0)
+    return LocalTaskManager
+
+
+def stored_statuses(path):
+    with sqlite3.connect(str(path)) as conn:
+        return dict(conn.execute("SELECT task_id, status FROM tasks").fetchall())
+
+
+def create_task(manager, task_id):
+    manager.create_task(task_id=task_id, session_id='s1', user_id='u1',
+                        task_description=f'task {task_id}', config={})
+
+
+def test_flush_writes_ops_the_writer_is_waiting_on(slow_writer, tmp_path):
+    """写入线程等待合并窗口期间，flush()（atexit钩子）仍能写出这些操作"""
+    path = tmp_path / 'tasks.db'
+    manager = slow_writer(storage_file=str(path), legacy_storage_file=str(tmp_path / 'tasks.pkl'))
+    create_task(manager, 'a1')
+    assert manager.update_task_status('a1', 'completed', result='done')
+    # 让写入线程醒来并进入等待
+    time.sleep(0.1)
+
+    manager.flush()
+
+    assert stored_statuses(path) == {'a1': 'completed'}
+    reloaded = slow_writer(storage_file=str(path), legacy_storage_file=str(tmp_path / 'tasks.pkl'))
+    assert reloaded.get_task('a1').status == 'completed'
+
+
+def test_concurrent_flushes_keep_queue_order(slow_writer, tmp_path, monkeypatch):
+    """并发flush按入队顺序提交：先删后建的任务不会被旧批次覆盖或删除"""
+    path = tmp_path / 'tasks.db'
+    manager = slow_writer(storage_file=str(path), legacy_storage_file=str(tmp_path / 'tasks.pkl'))
+
+    # 第一批写入时暂停，让第二个flush在它提交之前开始
+    write_ops = manager._write_ops
+    in_first_write = threading.Event()
+    release = threading.Event()
+
+    def slow_write_ops(ops):
+        if not in_first_write.is_set():
+            in_first_write.set()
+            release.wait(5)
+        write_ops(ops)
+
+    monkeypatch.setattr(manager, '_write_ops', slow_write_ops)
+
+    create_task(manager, 'a1')
+    first = threading.Thread(target=manager.flush)
+    first.start()
+    assert in_first_write.wait(5)
+
+    manager._queue_op('delete', 'a1')
+    second = threading.Thread(target=manager.flush)
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert stored_statuses(path) == {}
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+测试脚本导出接口
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def script_row():
+    return {
+        'id': 'sc1', 'task_id': 't1', 'task_name': '打开设置', 'description': '',
+        'total_steps': 2, 'success_rate': 100.0, 'execution_time': 1.5,
+        'device_id': None, 'model_name': 'autoglm-phone-9b',
+        'created_at': '2026-01-01T00:00:00', 'updated_at': '2026-01-01T00:00:00',
+        'script_data': {'steps': [{'action': 'Launch', 'app': '设置'}, {'action': 'Back'}]},
+        'script_metadata': {},
+    }
+
+
+@pytest.fixture
+def export_client(web, fake_client, script_row, monkeypatch):
+    from web.script_manager import ScriptManager
+
+    monkeypatch.setattr('web.script_manager.get_supabase_client', lambda purpose='read': fake_client)
+    fake_client.tables['scripts'] = [script_row]
+    web._script_manager = ScriptManager()
+    return web.app.test_client()
+
+
+def test_json_export_matches_indented_dump(export_client, script_row):
+    """JSON导出与json.dumps(indent=2)内容一致，非ASCII字符不转义"""
+    response = export_client.get('/api/scripts/sc1/export?format=json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    exported = json.loads(body)
+    assert exported.items() >= script_row.items()
+    assert body == json.dumps(exported, ensure_ascii=False, indent=2)
+
+
+def test_python_export_and_missing_script(export_client):
+    """Python重放脚本整体返回；脚本不存在时返回404"""
+    response = export_client.get('/api/scripts/sc1/export?format=python')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).startswith('#!/usr/bin/env python3')
+
+    assert export_client.get('/api/scripts/missing/export').status_code == 404
+
+
+@pytest.mark.parametrize('script_data', [
+    {'steps': [{'action': 'Launch', 'app': '设置', 'params': {'x': [1, 2], 'y': {}}}, {'action': 'Back'}],
+     'metadata': {'device': 'emu'}},
+    {'metadata': {'device': 'emu'}, 'steps': []},
+    {'steps': {'not': 'a list'}},
+    {},
+    None,
+])
+def test_iter_json_matches_json_dumps(script_data):
+    """逐步骤编码的结果与json.dumps(to_dict())一致（缩进与紧凑两种格式）"""
+    from web.script_manager import ScriptRecord
+
+    record = ScriptRecord(id='sc1', task_id='t1', task_name='打开设置', script_data=script_data,
+                          script_metadata={'note': 'line1\nline2'})
+
+    indented = b''.join(record.iter_json(chunk_size=16, indent=2)).decode('utf-8')
+    assert indented == json.dumps(record.to_dict(), ensure_ascii=False, indent=2)
+
+    compact = b''.join(record.iter_json(chunk_size=16)).decode('utf-8')
+    assert json.loads(compact) == record.to_dict()
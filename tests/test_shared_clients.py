@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+测试 Web 模块共享同一份 supabase_manager（同一个Supabase客户端）
+"""
+
+import sys
+
+
+def test_script_manager_and_app_share_client(web_app_module):
+    """script_manager与app拿到的是同一个客户端对象"""
+    from web import script_manager, supabase_manager
+
+    # 只加载了web.supabase_manager，没有按裸模块名再加载一份
+    assert 'supabase_manager' not in sys.modules
+    assert 'script_manager' not in sys.modules
+    assert script_manager.get_supabase_client is supabase_manager.get_supabase_client
+    assert web_app_module.get_script_manager is script_manager.get_script_manager
+
+    manager = script_manager.get_script_manager()
+    task_manager = supabase_manager.SupabaseTaskManager()
+    assert manager.supabase is task_manager.supabase
+    assert manager.writer is task_manager.writer
+
+
+def test_recorder_uses_app_script_manager(web_app_module):
+    """ScriptRecorder与Web接口复用同一个脚本管理器"""
+    from phone_agent import recorder
+
+    assert recorder.SCRIPT_MANAGER_AVAILABLE
+    assert recorder.get_script_manager is web_app_module.get_script_manager
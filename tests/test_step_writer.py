@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+测试 StepWriter 后台批量写入（顺序、flush屏障、insert_step_batch回退）
+"""
+
+from web.supabase_manager import StepWriter
+
+
+def make_writer(client):
+    writer = StepWriter(client)
+    # 不等待合并窗口，测试只关心写入顺序与结果
+    writer.FLUSH_INTERVAL = 0
+    return writer
+
+
+def step(step_id, number=1):
+    return {'id': step_id, 'task_id': 't1', 'step_number': number}
+
+
+def screenshot(shot_id, step_id):
+    return {'id': shot_id, 'task_id': 't1', 'step_id': step_id,
+            'screenshot_path': '/tmp/s.png', 'file_size': 10, 'file_hash': 'abc'}
+
+
+def test_thread_starts_lazily(fake_client):
+    """创建时不启动线程，第一次入队时才启动"""
+    writer = make_writer(fake_client)
+    assert writer._thread is None
+    assert writer.flush(timeout=1)
+
+    writer.put('task_steps', step('s1'))
+    try:
+        assert writer._thread is not None and writer._thread.is_alive()
+    finally:
+        writer.close()
+    assert writer._thread is None
+
+
+def test_flush_waits_for_queued_rows(fake_client):
+    """flush返回时此前入队的记录已写入"""
+    writer = make_writer(fake_client)
+    try:
+        for i in range(5):
+            writer.put('task_steps', step(f's{i}', i))
+        assert writer.flush(timeout=5)
+        assert [row['id'] for row in fake_client.tables['task_steps']] == [f's{i}' for i in range(5)]
+    finally:
+        writer.close()
+
+
+def test_steps_inserted_before_screenshots(fake_client):
+    """截图先入队时，仍先插入步骤再插入截图（step_id外键）"""
+    writer = make_writer(fake_client)
+    writer.rpc_available = False
+    # 在后台线程取到第一条之前把整批放入队列
+    writer._queue.put(('step_screenshots', screenshot('p1', 's1')))
+    writer._queue.put(('task_steps', step('s1')))
+    try:
+        writer.put('task_steps', step('s2', 2))
+        assert writer.flush(timeout=5)
+    finally:
+        writer.close()
+
+    inserts = [call for call in fake_client.calls if call[0] == 'insert']
+    assert inserts == [('insert', 'task_steps'), ('insert', 'step_screenshots')]
+    assert [row['id'] for row in fake_client.tables['task_steps']] == ['s1', 's2']
+
+
+def test_batch_rpc_used_when_available(fake_client, insert_step_batch_rpc):
+    """函数存在时步骤和截图在一次RPC中写入"""
+    fake_client.rpc_handlers['insert_step_batch'] = insert_step_batch_rpc
+    writer = make_writer(fake_client)
+    writer._queue.put(('task_steps', step('s1')))
+    try:
+        writer.put('step_screenshots', screenshot('p1', 's1'))
+        assert writer.flush(timeout=5)
+    finally:
+        writer.close()
+
+    assert fake_client.calls == [('rpc', 'insert_step_batch')]
+    assert writer.rpc_available
+    assert fake_client.tables['step_screenshots'][0]['step_id'] == 's1'
+
+
+def test_missing_rpc_falls_back_to_table_inserts(fake_client):
+    """PGRST202（函数不存在）：本批按表插入，之后不再调用RPC"""
+    writer = make_writer(fake_client)
+    try:
+        for n in (1, 2):
+            writer._queue.put(('task_steps', step(f's{n}', n)))
+            writer.put('step_screenshots', screenshot(f'p{n}', f's{n}'))
+            assert writer.flush(timeout=5)
+    finally:
+        writer.close()
+
+    assert not writer.rpc_available
+    assert fake_client.calls.count(('rpc', 'insert_step_batch')) == 1
+    assert [row['id'] for row in fake_client.tables['task_steps']] == ['s1', 's2']
+    assert [row['id'] for row in fake_client.tables['step_screenshots']] == ['p1', 'p2']
+
+
+def test_other_rpc_errors_keep_rpc_enabled(fake_client, api_error):
+    """函数内部的其他错误只让本批回退，不永久关闭RPC"""
+    def failing(client, params):
+        raise api_error('insert_step_batch: statement timeout', code='57014')
+
+    fake_client.rpc_handlers['insert_step_batch'] = failing
+    writer = make_writer(fake_client)
+    writer._queue.put(('task_steps', step('s1')))
+    try:
+        writer.put('step_screenshots', screenshot('p1', 's1'))
+        assert writer.flush(timeout=5)
+    finally:
+        writer.close()
+
+    assert writer.rpc_available
+    assert [row['id'] for row in fake_client.tables['task_steps']] == ['s1']
+    assert [row['id'] for row in fake_client.tables['step_screenshots']] == ['p1']
+
+
+def test_task_managers_share_one_writer(supabase_task_manager, fake_client):
+    """多个SupabaseTaskManager共用同一个写入器（只有一个后台线程）"""
+    from web.supabase_manager import SupabaseTaskManager, get_step_writer
+
+    other = SupabaseTaskManager()
+    assert supabase_task_manager._step_writer is other._step_writer is get_step_writer()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试共享Supabase客户端的httpx连接池注入
+"""
+
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import pytest
+
+from web import supabase_manager
+
+
+class FakeHttpxClient:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+@dataclass
+class FakeClientOptions:
+    httpx_client: object = None
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """记录每次create_client的参数"""
+    calls = []
+
+    def create_client(url, key, options=None):
+        calls.append({'url': url, 'key': key, 'options': options})
+        return object()
+
+    monkeypatch.setattr(supabase_manager, 'create_client', create_client)
+    monkeypatch.setattr(supabase_manager, 'ClientOptions', FakeClientOptions, raising=False)
+    monkeypatch.setattr(supabase_manager, 'httpx', SimpleNamespace(
+        Client=FakeHttpxClient, Limits=lambda **kwargs: kwargs
+    ), raising=False)
+    monkeypatch.setattr(supabase_manager, 'SUPABASE_MAX_CONNECTIONS', 8)
+    monkeypatch.setattr(supabase_manager, 'SUPABASE_MAX_KEEPALIVE', 4)
+    supabase_manager.get_supabase_client.cache_clear()
+    yield calls
+    supabase_manager.get_supabase_client.cache_clear()
+
+
+def test_injects_pooled_httpx_client(created, monkeypatch):
+    """支持httpx_client时，按配置的连接池上限创建并传入客户端"""
+    monkeypatch.setattr(supabase_manager, 'HTTPX_CLIENT_INJECTION', True)
+
+    supabase_manager.get_supabase_client('read')
+
+    assert len(created) == 1
+    options = created[0]['options']
+    assert isinstance(options, FakeClientOptions)
+    http_client = options.httpx_client
+    assert isinstance(http_client, FakeHttpxClient)
+    assert http_client.kwargs['limits'] == {'max_connections': 8, 'max_keepalive_connections': 4}
+    assert http_client.kwargs['timeout'] == supabase_manager.SUPABASE_HTTP_TIMEOUT
+
+
+def test_read_and_write_clients_have_separate_pools(created, monkeypatch):
+    """读写客户端各自缓存，使用独立的httpx客户端"""
+    monkeypatch.setattr(supabase_manager, 'HTTPX_CLIENT_INJECTION', True)
+
+    read = supabase_manager.get_supabase_client('read')
+    write = supabase_manager.get_supabase_client('write')
+
+    assert read is supabase_manager.get_supabase_client('read')
+    assert read is not write
+    assert len(created) == 2
+    assert created[0]['options'].httpx_client is not created[1]['options'].httpx_client
+
+
+def test_older_supabase_uses_default_client(created, monkeypatch):
+    """旧版本supabase-py（无httpx_client字段）不传options"""
+    monkeypatch.setattr(supabase_manager, 'HTTPX_CLIENT_INJECTION', False)
+
+    supabase_manager.get_supabase_client('read')
+
+    assert created == [{'url': supabase_manager.SUPABASE_URL, 'key': supabase_manager.SUPABASE_KEY,
+                        'options': None}]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+测试 Web 接口：任务列表 ETag/304、同一会话中停止运行中的任务
+"""
+
+import threading
+import time
+
+from phone_agent.stop_handler import StopException
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def create_task(manager, task_id, session_id='s1'):
+    manager.create_task(
+        task_id=task_id,
+        session_id=session_id,
+        user_id='web_user',
+        task_description=f'task {task_id}',
+        config={}
+    )
+
+
+def test_task_list_etag_round_trip(web, task_manager):
+    """未变化时返回304，任务变化后返回新的列表和ETag"""
+    create_task(task_manager, 'a1')
+    client = web.app.test_client()
+
+    first = client.get('/api/tasks')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert [t['task_id'] for t in first.get_json()['data']['tasks']] == ['a1']
+
+    cached = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert not cached.data
+
+    assert task_manager.update_task_status('a1', 'completed', result='done')
+    changed = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['data']['tasks'][0]['status'] == 'completed'
+
+
+def test_task_list_etag_is_per_session(web, task_manager):
+    """会话过滤的列表与全部列表使用不同的ETag"""
+    create_task(task_manager, 'a1', session_id='s1')
+    client = web.app.test_client()
+
+    all_tasks = client.get('/api/tasks')
+    all_tasks.get_data()
+    session_tasks = client.get('/api/tasks?session_id=s1')
+    session_tasks.get_data()
+    assert all_tasks.headers['ETag'] != session_tasks.headers['ETag']
+    other_scope = client.get('/api/tasks?session_id=s1', headers={'If-None-Match': all_tasks.headers['ETag']})
+    assert other_scope.status_code == 200
+    assert [t['task_id'] for t in other_scope.get_json()['data']['tasks']] == ['a1']
+
+
+def test_statistics_etag_follows_task_and_step_writes(web, supabase_task_manager, web_app_module, monkeypatch):
+    """统计的ETag随本进程的任务变化和步骤写入变化"""
+    monkeypatch.setattr(web_app_module, 'global_task_manager', supabase_task_manager)
+    # 时间窗口足够长，测试中只有写入会让ETag变化
+    monkeypatch.setattr(web, 'STATISTICS_ETAG_TTL', 3600)
+    client = web.app.test_client()
+
+    first = client.get('/api/statistics')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get('/api/statistics', headers={'If-None-Match': etag}).status_code == 304
+
+    create_task(supabase_task_manager, 'a1')
+    after_task = client.get('/api/statistics', headers={'If-None-Match': etag})
+    assert after_task.status_code == 200
+    etag = after_task.headers['ETag']
+
+    supabase_task_manager.enqueue_step({'task_id': 'a1', 'step_number': 1})
+    assert supabase_task_manager.flush_steps()
+    after_step = client.get('/api/statistics', headers={'If-None-Match': etag})
+    assert after_step.status_code == 200
+    assert client.get('/api/statistics',
+                      headers={'If-None-Match': after_step.headers['ETag']}).status_code == 304
+
+
+def test_statistics_etag_expires_without_local_writes(web, supabase_task_manager, web_app_module, monkeypatch):
+    """其他进程的写入不改变本进程的计数，ETag在STATISTICS_ETAG_TTL后仍会失效"""
+    monkeypatch.setattr(web_app_module, 'global_task_manager', supabase_task_manager)
+    monkeypatch.setattr(web, 'STATISTICS_ETAG_TTL', 0.05)
+    client = web.app.test_client()
+
+    etag = client.get('/api/statistics').headers['ETag']
+    time.sleep(0.1)
+    refreshed = client.get('/api/statistics', headers={'If-None-Match': etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers['ETag'] != etag
+
+
+def test_full_step_batch_does_not_add_timers(web, monkeypatch):
+    """达到STEP_BATCH_MAX时立即发送，每个会话最多只有一个窗口定时任务"""
+    timers = []
+    emitted = []
+    monkeypatch.setattr(web.socketio, 'start_background_task', lambda func, *args: timers.append((func, args)))
+    monkeypatch.setattr(web.socketio, 'emit', lambda event, data, room=None: emitted.append((event, data)))
+    monkeypatch.setattr(web, '_room_has_listeners', lambda room: True)
+
+    total = web.STEP_BATCH_MAX * 2 + 5
+    for number in range(total):
+        web._queue_step_update('s1', {'session_id': 's1', 'step': {'step_number': number}})
+
+    assert len(timers) == 1
+    assert [len(data['steps']) for _, data in emitted] == [web.STEP_BATCH_MAX] * 2
+
+    func, args = timers.pop()
+    func(*args)
+    assert [len(data['steps']) for _, data in emitted[2:]] == [5]
+    numbers = [step['step']['step_number'] for _, data in emitted for step in data['steps']]
+    assert numbers == list(range(total))
+
+    # 定时任务结束后，下一步会重新安排一个
+    web._queue_step_update('s1', {'session_id': 's1', 'step': {'step_number': total}})
+    assert len(timers) == 1
+
+
+class FakeAgent:
+    """替代 PhoneAgent：不断回调step_callback，直到被停止"""
+
+    def __init__(self, model_config=None, agent_config=None, task_id=None):
+        self.task_id = task_id
+        self.recorder = None
+        self._stopped = threading.Event()
+        self._stop_message = None
+
+    def run(self, task, step_callback=None):
+        for number in range(1, 1000):
+            if self._stopped.is_set():
+                raise StopException(self._stop_message)
+            step_callback({'task_id': self.task_id, 'step_number': number,
+                           'thinking': '', 'action': None, 'result': None,
+                           'success': True, 'finished': False})
+            time.sleep(0.01)
+        return 'done'
+
+    def stop(self, reason=None, message=None):
+        self._stop_message = message
+        self._stopped.set()
+
+
+def test_stop_targets_running_task_not_queued_one(web, web_app_module, local_manager, monkeypatch):
+    """单个worker：停止第一个任务不影响排队中的第二个任务，第二个任务随后开始执行"""
+    monkeypatch.setattr(web_app_module, 'global_task_manager', local_manager)
+    monkeypatch.setattr(web_app_module, 'PhoneAgent', FakeAgent)
+    assert web.max_concurrent_tasks == 1
+
+    session_id = web.app.test_client().post('/api/sessions', json={'user_id': 'u1'}).get_json()['session_id']
+    session = web.sessions[session_id]
+    sio = web.socketio.test_client(web.app)
+    sio.emit('join_session', {'session_id': session_id})
+
+    sio.emit('send_task', {'session_id': session_id, 'task': 'first'})
+    assert wait_for(lambda: session.task_id is not None)
+    first_id = session.task_id
+    first_event = web._cancel_events[first_id]
+
+    sio.emit('send_task', {'session_id': session_id, 'task': 'second'})
+    second_id = next(task_id for task_id in web._cancel_events if task_id != first_id)
+    second_event = web._cancel_events[second_id]
+    # 第二个任务在队列中等待唯一的worker
+    assert session.task_id == first_id
+
+    sio.emit('stop_task', {'session_id': session_id})
+    assert first_event.is_set()
+    assert not second_event.is_set()
+
+    # 第一个任务结束后，排队的任务开始运行并成为会话的当前任务
+    assert wait_for(lambda: session.task_id == second_id)
+    assert session.cancel_event is second_event
+    assert wait_for(lambda: local_manager.get_task(second_id) is not None)
+
+    sio.emit('stop_task', {'session_id': session_id})
+    assert second_event.is_set()
+    assert wait_for(lambda: not web._task_futures)
+    assert local_manager.get_task(first_id).status == 'stopped'
+    sio.disconnect()
@@ -5,20 +5,48 @@ Web interface for Phone Agent with multi-turn conversation support
 """
 
 import os
+
+# SOCKETIO_ASYNC_MODE=eventlet serves many sockets from one worker with green threads.
+# The stdlib must be monkey-patched before anything else imports it, so this runs first.
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE') or None
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 import sys
+import time
+import atexit
 import json
 import asyncio
 import threading
+import heapq
+import hashlib
+import secrets
+import io
 import pickle
+import queue
+import sqlite3
 import logging
+import mimetypes
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, asdict, fields
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory, Response
+from flask import Flask, render_template, request, jsonify, session, send_from_directory, Response, stream_with_context, abort
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from urllib.parse import quote as url_quote
 import uuid
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict, defaultdict, deque
+from itertools import count, groupby, islice
+from functools import lru_cache
+from operator import attrgetter, itemgetter
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -38,14 +66,32 @@ except ImportError:
 except Exception as e:
     print(f"⚠️  加载环境变量时出错: {e}")
 
+# orjson is optional: it speeds up JSON responses and SocketIO frames when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# ciso8601 is optional: a C ISO 8601 parser used by the datetimeformat template filter
+try:
+    from ciso8601 import parse_datetime as _parse_iso8601
+    CISO8601_AVAILABLE = True
+except ImportError:
+    CISO8601_AVAILABLE = False
+
 from phone_agent import PhoneAgent
 from phone_agent.model import ModelConfig
 from phone_agent.agent import AgentConfig
 from phone_agent.recorder import ScriptRecorder
 from phone_agent.stop_handler import StopException, StopReason
+from phone_agent.adb import list_devices as adb_list_devices
+from phone_agent.config.apps import APP_PACKAGES
+
+# Supported app names never change at runtime
+APP_NAMES = tuple(APP_PACKAGES.keys())
 
 # Initialize logger early
-import logging
 logger = logging.getLogger(__name__)
 
 # 导入脚本管理器
@@ -78,27 +124,37 @@ except ImportError as e:
             return self.task_id
 
 try:
-    from script_manager import ScriptManager
+    from web.script_manager import get_script_manager
     SCRIPT_MANAGER_AVAILABLE = True
 except ImportError:
     SCRIPT_MANAGER_AVAILABLE = False
 
+try:
+    from web.supabase_manager import get_local_file_scanner
+    LOCAL_FILE_SCANNER_AVAILABLE = True
+except ImportError:
+    LOCAL_FILE_SCANNER_AVAILABLE = False
+
 
 # Helper functions for step tracking
 def calculate_file_hash(file_path: str) -> str:
     """
-    Calculate MD5 hash of a file.
+    Calculate SHA256 hash of a file, streaming it in chunks.
 
     Args:
         file_path: Path to the file
 
     Returns:
-        MD5 hash as a hex string
+        SHA256 hash as a hex string (matches step_screenshots.file_hash)
     """
-    import hashlib
     try:
         with open(file_path, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+            if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
     except Exception as e:
         logger.error(f"Failed to calculate file hash: {e}")
         return ""
@@ -120,58 +176,306 @@ def get_file_size(file_path: str) -> int:
         return 0
 
 
-class PhoneAgentWeb:
+class _LegacyTaskUnpickler(pickle.Unpickler):
+    """Unpickler for tasks stored by older versions.
+
+    Those pickles reference GlobalTask under whatever module name app.py ran as
+    ('__main__', 'app', ...); resolving that name would import (and run) this
+    module a second time, so GlobalTask is mapped to the class loaded here.
+    """
+
+    def find_class(self, module, name):
+        if name == 'GlobalTask':
+            return GlobalTask
+        return super().find_class(module, name)
+
+
+class LocalTaskManager:
+    """SQLite-backed task store used when the Supabase task manager is unavailable"""
+
+    # Number of lock stripes; must be a power of two
+    LOCK_STRIPES = 16
+    # Statuses after which a task is eligible for cleanup
+    TERMINAL_STATUSES = frozenset({"completed", "error", "stopped"})
 
-    def __init__(self, storage_file: str = "web_tasks.pkl"):
+    def __init__(self, storage_file: str = "web_tasks.db", legacy_storage_file: str = "web_tasks.pkl"):
         self.storage_file = Path(__file__).parent / storage_file
+        self.legacy_storage_file = Path(__file__).parent / legacy_storage_file
         self.tasks: Dict[str, GlobalTask] = {}
-        self.active_threads: Dict[str, threading.Thread] = {}
+        # Weak references: finished threads/futures drop out on their own
+        self.active_threads: 'weakref.WeakValueDictionary[str, Any]' = weakref.WeakValueDictionary()
+        # Min-heap of (created_at timestamp, task_id) for finished tasks only, so cleanup
+        # touches just the expired ones; stale entries are skipped lazily when popped
+        self._age_heap: List[Tuple[float, str]] = []
+        # Striped per-task locks: updates to unrelated tasks never wait on each other
+        self._task_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # session_id -> task_ids, so per-session lookups don't scan every task
+        self._by_session: Dict[str, Set[str]] = defaultdict(set)
+        # Guards the age heap, the session index and task insertion/removal
+        self._index_lock = threading.Lock()
+        # Canonical config blob -> shared dict; tasks started with the same settings
+        # reference one config object instead of each holding its own copy
+        self._config_pool: Dict[str, Dict] = {}
+        # Bumped on every task mutation; /api/tasks derives its ETag from it
+        self.version = 0
+        self._versions = count(1)
+
+        # SQLite (WAL) store: each mutation writes a single row instead of the whole task set
+        self._conn = sqlite3.connect(str(self.storage_file), isolation_level=None, check_same_thread=False)
+        # Return pages freed by cleanup deletes to the OS instead of keeping the file at its peak size;
+        # an existing file is converted once (auto_vacuum only takes effect through a VACUUM)
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("VACUUM")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                session_id TEXT,
+                user_id TEXT,
+                status TEXT,
+                created_at REAL,
+                last_activity REAL,
+                payload BLOB
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_session_id ON tasks(session_id)")
         self.load_tasks()
 
+        # Pickling and disk I/O happen on a dedicated writer thread;
+        # callers only post row operations, self.tasks stays the write-through cache
+        self._save_queue: queue.Queue = queue.Queue()
+        # Set when an operation is queued; ops stay in the queue (visible to flush()) until written
+        self._dirty = threading.Event()
+        # Held while draining *and* writing, so batches reach SQLite in queue order
+        self._write_lock = threading.Lock()
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name="web-task-writer", daemon=True
+        )
+        self._writer_thread.start()
+        # Write whatever is still queued when the process exits
+        atexit.register(self.flush)
+
     def load_tasks(self):
         """Load tasks from storage"""
-        if self.storage_file.exists():
-            try:
-                with open(self.storage_file, 'rb') as f:
-                    self.tasks = pickle.load(f)
-                print(f"Loaded {len(self.tasks)} tasks from storage")
-            except Exception as e:
-                print(f"Failed to load tasks: {e}")
-                self.tasks = {}
+        try:
+            rows = self._conn.execute("SELECT task_id, payload FROM tasks").fetchall()
+            self.tasks = {task_id: self._load_task(payload) for task_id, payload in rows}
+            if not self.tasks and self.legacy_storage_file.exists():
+                self._migrate_legacy_pickle()
+            print(f"Loaded {len(self.tasks)} tasks from storage")
+        except Exception as e:
+            print(f"Failed to load tasks: {e}")
+            self.tasks = {}
+        self._age_heap = [
+            (task.created_at.timestamp(), task_id) for task_id, task in self.tasks.items()
+            if task.status in self.TERMINAL_STATUSES
+        ]
+        heapq.heapify(self._age_heap)
+        self._by_session = defaultdict(set)
+        for task_id, task in self.tasks.items():
+            self._by_session[task.session_id].add(task_id)
+            task.config = self._intern_config(task.config)
+
+    def _intern_config(self, config: Dict) -> Dict:
+        """Return the pooled dict equal to config (shared between tasks, treat as read-only)"""
+        try:
+            key = json.dumps(config, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            # Not canonically serializable, keep a private copy
+            return dict(config)
+        pooled = self._config_pool.get(key)
+        if pooled is None:
+            pooled = self._config_pool.setdefault(key, dict(config))
+        return pooled
+
+    def _migrate_legacy_pickle(self):
+        """Import tasks from the old whole-dict pickle file into SQLite"""
+        with open(self.legacy_storage_file, 'rb', buffering=self._PICKLE_BUFFER_SIZE) as f:
+            self.tasks = _LegacyTaskUnpickler(f).load()
+        self._conn.execute("BEGIN")
+        self._conn.executemany(self._UPSERT_SQL, [self._task_row(task) for task in self.tasks.values()])
+        self._conn.execute("COMMIT")
+        print(f"Migrated {len(self.tasks)} tasks from {self.legacy_storage_file.name}")
+
+    _UPSERT_SQL = (
+        "INSERT OR REPLACE INTO tasks "
+        "(task_id, session_id, user_id, status, created_at, last_activity, payload) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    _UPDATE_SQL = "UPDATE tasks SET status = ?, last_activity = ?, payload = ? WHERE task_id = ?"
+    _DELETE_SQL = "DELETE FROM tasks WHERE task_id = ?"
+
+    # Large read buffer for the one-off legacy pickle import
+    _PICKLE_BUFFER_SIZE = 1 << 20
+
+    _DATETIME_FIELDS = ('created_at', 'last_activity', 'end_time')
+    _TASK_FIELDS = frozenset(field.name for field in fields(GlobalTask))
+
+    @staticmethod
+    def _dump_task(task: GlobalTask) -> bytes:
+        """Encode a task as a flat JSON object (datetimes as ISO strings)"""
+        data = {field.name: getattr(task, field.name) for field in fields(task)}
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(data)
+        return json.dumps(data, default=datetime.isoformat).encode('utf-8')
+
+    @classmethod
+    def _load_task(cls, payload: bytes) -> GlobalTask:
+        """Decode a stored task row; rows written by older versions are pickles"""
+        if payload[:1] != b'{':
+            return _LegacyTaskUnpickler(io.BytesIO(payload)).load()
+        data = orjson.loads(payload) if ORJSON_AVAILABLE else json.loads(payload)
+        for name in cls._DATETIME_FIELDS:
+            if data.get(name):
+                data[name] = datetime.fromisoformat(data[name])
+        return GlobalTask(**{k: v for k, v in data.items() if k in cls._TASK_FIELDS})
+
+    @classmethod
+    def _task_row(cls, task: GlobalTask) -> tuple:
+        return (
+            task.task_id, task.session_id, task.user_id, task.status,
+            task.created_at.timestamp(), task.last_activity.timestamp(),
+            cls._dump_task(task)
+        )
 
     def save_tasks(self):
-        """Save tasks to storage"""
+        """Request an asynchronous save of all tasks to storage"""
+        for task in list(self.tasks.values()):
+            self._queue_op('upsert', task)
+
+    def _queue_op(self, op: str, item: Any):
+        """Queue a row operation for the writer thread"""
+        self._save_queue.put_nowait((op, item))
+        self._dirty.set()
+
+    # Seconds to wait after the first queued operation so a burst is flushed together
+    FLUSH_INTERVAL = 0.25
+
+    def _writer_loop(self):
+        """Writer thread: apply queued row operations to SQLite"""
+        while True:
+            self._dirty.wait()
+            time.sleep(self.FLUSH_INTERVAL)
+            # Cleared before draining: an op queued from here on sets it again
+            self._dirty.clear()
+            self.flush()
+
+    def flush(self):
+        """Drain the operation queue and write it out in one transaction"""
+        with self._write_lock:
+            ops = []
+            try:
+                while True:
+                    ops.append(self._save_queue.get_nowait())
+            except queue.Empty:
+                pass
+            if ops:
+                self._write_ops(self._coalesce_ops(ops))
+
+    @staticmethod
+    def _coalesce_ops(ops: List[tuple]) -> List[tuple]:
+        """Keep only the last operation per task; the row is written from current task state"""
+        latest: Dict[str, tuple] = {}
+        for op, item in ops:
+            task_id = item if op == 'delete' else item.task_id
+            previous = latest.pop(task_id, None)
+            # An update after a pending insert still needs the full row
+            if op == 'update' and previous is not None and previous[0] == 'upsert':
+                op = 'upsert'
+            latest[task_id] = (op, item)
+        return list(latest.values())
+
+    def _write_ops(self, ops: List[tuple]):
+        """Apply a batch of (op, task_or_id) operations in a single transaction"""
         try:
-            with open(self.storage_file, 'wb') as f:
-                pickle.dump(self.tasks, f)
+            self._conn.execute("BEGIN")
+            for op, item in ops:
+                if op == 'upsert':
+                    self._conn.execute(self._UPSERT_SQL, self._task_row(item))
+                elif op == 'update':
+                    self._conn.execute(
+                        self._UPDATE_SQL,
+                        (item.status, item.last_activity.timestamp(), self._dump_task(item), item.task_id)
+                    )
+                elif op == 'delete':
+                    self._conn.execute(self._DELETE_SQL, (item,))
+            self._conn.execute("COMMIT")
+            if any(op == 'delete' for op, _ in ops):
+                # executescript steps the pragma to completion; execute() would free a single page
+                self._conn.executescript("PRAGMA incremental_vacuum;")
         except Exception as e:
             print(f"Failed to save tasks: {e}")
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
 
     def create_task(self, task_id: str, session_id: str, user_id: str,
                    task_description: str, config: Dict) -> GlobalTask:
         """Create a new global task"""
+        now = datetime.now()
         task = GlobalTask(
             task_id=task_id,
             session_id=session_id,
             user_id=user_id,
             task_description=task_description,
             status="running",
-            created_at=datetime.now(),
-            last_activity=datetime.now(),
-            config=config
+            created_at=now,
+            last_activity=now,
+            config=self._intern_config(config or {})
         )
-        self.tasks[task_id] = task
-        self.save_tasks()
+        with self._index_lock:
+            self.tasks[task_id] = task
+            self._by_session[session_id].add(task_id)
+        self.version = next(self._versions)
+        self._queue_op('upsert', task)
         return task
 
-    def update_task_status(self, task_id: str, status: str, error_message: str = None):
-        """Update task status"""
-        if task_id in self.tasks:
-            self.tasks[task_id].status = status
-            self.tasks[task_id].last_activity = datetime.now()
+    def _task_lock(self, task_id: str) -> threading.Lock:
+        """Lock stripe guarding the given task"""
+        return self._task_locks[hash(task_id) & (self.LOCK_STRIPES - 1)]
+
+    def update_task_status(self, task_id: str, status: str, error_message: str = None, result: str = None):
+        """Update task status (same signature as SupabaseTaskManager.update_task_status)"""
+        with self._task_lock(task_id):
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            if (task.status == status and (not error_message or task.error_message == error_message)
+                    and (not result or task.result == result)):
+                # Nothing persisted changes (e.g. a repeated heartbeat): touch in memory only
+                task.last_activity = datetime.now()
+                self.version = next(self._versions)
+                return True
+            finished = task.status not in self.TERMINAL_STATUSES and status in self.TERMINAL_STATUSES
+            task.status = status
+            task.last_activity = datetime.now()
             if error_message:
-                self.tasks[task_id].error_message = error_message
-            self.save_tasks()
+                task.error_message = error_message
+            if result:
+                task.result = result
+            if finished:
+                task.end_time = task.last_activity
+        self.version = next(self._versions)
+        if finished:
+            # Only finished tasks can expire; queue it for cleanup once
+            with self._index_lock:
+                heapq.heappush(self._age_heap, (task.created_at.timestamp(), task_id))
+        self._queue_op('update', task)
+        return True
+
+    def update_task(self, task_id: str, **kwargs) -> bool:
+        """Set arbitrary task fields (e.g. script_id); unknown field names are ignored"""
+        with self._task_lock(task_id):
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            for name, value in kwargs.items():
+                if name in self._TASK_FIELDS:
+                    setattr(task, name, value)
+        self.version = next(self._versions)
+        self._queue_op('update', task)
+        return True
 
     def get_task(self, task_id: str) -> Optional[GlobalTask]:
         """Get task by ID"""
@@ -183,12 +487,22 @@ class PhoneAgentWeb:
 
     def get_tasks_by_session(self, session_id: str) -> List[GlobalTask]:
         """Get tasks by session ID"""
-        return [task for task in self.tasks.values() if task.session_id == session_id]
+        with self._index_lock:
+            task_ids = list(self._by_session.get(session_id, ()))
+        return [self.tasks[task_id] for task_id in task_ids if task_id in self.tasks]
+
+    def count_tasks(self) -> int:
+        """Number of stored tasks"""
+        return len(self.tasks)
 
     def register_thread(self, task_id: str, thread: threading.Thread):
         """Register a thread for a task"""
         self.active_threads[task_id] = thread
 
+    def unregister_thread(self, task_id: str):
+        """Unregister a task's thread once it has finished"""
+        self.active_threads.pop(task_id, None)
+
     def stop_task(self, task_id: str) -> bool:
         """Stop a task"""
         if task_id in self.active_threads:
@@ -205,30 +519,135 @@ class PhoneAgentWeb:
     def cleanup_old_tasks(self, hours: int = 24):
         """Clean up old tasks"""
         cutoff_time = datetime.now().timestamp() - (hours * 3600)
-        old_tasks = [
-            task_id for task_id, task in self.tasks.items()
-            if task.created_at.timestamp() < cutoff_time and task.status in ["completed", "error", "stopped"]
-        ]
+        old_tasks = []
+        with self._index_lock:
+            while self._age_heap and self._age_heap[0][0] < cutoff_time:
+                _, task_id = heapq.heappop(self._age_heap)
+                task = self.tasks.get(task_id)
+                # Tombstone: the task is already gone or was restarted since it was queued
+                if task is None or task.status not in self.TERMINAL_STATUSES:
+                    continue
+                old_tasks.append(task_id)
+                del self.tasks[task_id]
+                session_tasks = self._by_session.get(task.session_id)
+                if session_tasks is not None:
+                    session_tasks.discard(task_id)
+                    if not session_tasks:
+                        del self._by_session[task.session_id]
         for task_id in old_tasks:
-            del self.tasks[task_id]
+            self._queue_op('delete', task_id)
         if old_tasks:
-            self.save_tasks()
+            self.version = next(self._versions)
             print(f"Cleaned up {len(old_tasks)} old tasks")
 
 
-# Global task manager instance - 使用Supabase
+# Global task manager instance - 使用Supabase，不可用时回退到本地SQLite存储
 global_task_manager = None
-try:
-    from supabase_manager import SupabaseTaskManager
-    global_task_manager = SupabaseTaskManager()
-    print("✅ Supabase任务管理器初始化成功")
-except Exception as e:
-    print(f"❌ Supabase任务管理器初始化失败: {e}")
+if SUPABASE_AVAILABLE:
+    try:
+        global_task_manager = SupabaseTaskManager()
+        print("✅ Supabase任务管理器初始化成功")
+    except Exception as e:
+        print(f"❌ Supabase任务管理器初始化失败: {e}")
+if global_task_manager is None:
     print("回退到本地存储...")
-    global_task_manager = None
+    global_task_manager = LocalTaskManager()
+
+# 会话内存中保留的历史记录/截图上限，防止长任务导致内存无限增长
+# （完整对话记录追加写入 CONVERSATION_LOG_DIR 下的JSONL文件，内存中只保留最近几条）
+AGENT_HIST_MAX = int(os.getenv('AGENT_HIST_MAX', 32))
+AGENT_SCREENSHOTS_MAX = int(os.getenv('AGENT_SCREENSHOTS_MAX', 50))
+
 
-# 创建本地Web任务管理器作为回退
-web_task_manager = PhoneAgentWeb()
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib encoder"""
+
+    # datetime/dataclass objects go through Flask's own default() so output matches jsonify;
+    # int/None dict keys are stringified like the stdlib encoder does instead of raising
+    _OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+    ) if ORJSON_AVAILABLE else 0
+
+    def dumps(self, obj, **kwargs):
+        # Pretty-printing (debug mode) and other stdlib-only options keep the default encoder;
+        # compact separators are what orjson produces anyway
+        if kwargs and kwargs != {'separators': (',', ':')}:
+            return super().dumps(obj, **kwargs)
+        option = self._OPTIONS | orjson.OPT_SORT_KEYS if self.sort_keys else self._OPTIONS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+class OrjsonSocketIOJSON:
+    """json-module compatible wrapper used by Flask-SocketIO to encode packets"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        try:
+            # orjson always emits compact separators, which is what socketio asks for;
+            # a caller-supplied default= hook is honoured by orjson as well
+            return orjson.dumps(
+                obj, default=kwargs.get('default'), option=orjson.OPT_NON_STR_KEYS
+            ).decode('utf-8')
+        except TypeError:
+            return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+
+@lru_cache(maxsize=4096)
+def parse_iso_datetime(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp; the same stored strings recur across renders, so results are memoized"""
+    if CISO8601_AVAILABLE:
+        return _parse_iso8601(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# API datetimes are naive UTC: orjson writes them as ISO 8601 with a 'Z' suffix in C.
+# Non-string dict keys (e.g. step numbers) are stringified as the stdlib encoder would.
+JSON_BYTES_OPTIONS = (
+    orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+) if ORJSON_AVAILABLE else 0
+
+
+def _json_default(obj: Any) -> Any:
+    """Stdlib fallback for json_bytes, formatting datetimes the way orjson does"""
+    if isinstance(obj, datetime):
+        return obj.isoformat() + 'Z' if obj.tzinfo is None else obj.isoformat()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    return str(obj)
+
+
+def json_bytes(obj: Any) -> bytes:
+    """Encode a value to compact UTF-8 JSON bytes (orjson when it can handle the value)"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, option=JSON_BYTES_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    """Serialize a response payload straight to bytes (orjson when available)"""
+    return Response(json_bytes(payload), status=status, mimetype='application/json')
+
+
+# The app list is fixed for the life of the process: encode it (and its ETag) once
+APP_NAMES_JSON = json_bytes(APP_NAMES)
+APP_NAMES_ETAG = hashlib.sha1(APP_NAMES_JSON).hexdigest()
 
 
 @dataclass
@@ -240,15 +659,48 @@ class TaskSession:
     last_activity: datetime
     agent: Optional[PhoneAgent] = None
     current_task: Optional[str] = None
+    # Database id of the task currently (or last) run in this session
+    task_id: Optional[str] = None
     task_status: str = "idle"  # idle, running, completed, error
-    conversation_history: List[Dict] = None
-    screenshots: List[str] = None
+    conversation_history: Deque[Dict] = None
+    screenshots: Deque[str] = None
+    # Set to stop the running task; checked by the step callback
+    cancel_event: Optional[threading.Event] = None
+    # Append-only JSONL file holding the full conversation (None: memory only)
+    log_path: Optional[Path] = None
+    message_count: int = 0
 
     def __post_init__(self):
-        if self.conversation_history is None:
-            self.conversation_history = []
-        if self.screenshots is None:
-            self.screenshots = []
+        # Ring buffers: oldest entries are dropped once the cap is reached
+        self.conversation_history = deque(self.conversation_history or (), maxlen=AGENT_HIST_MAX)
+        self.screenshots = deque(self.screenshots or (), maxlen=AGENT_SCREENSHOTS_MAX)
+
+    def record_message(self, message: Dict):
+        """Add a conversation message: recent ones stay in memory, all go to the log file"""
+        self.conversation_history.append(message)
+        self.message_count += 1
+        if self.log_path is None:
+            return
+        if ORJSON_AVAILABLE:
+            line = orjson.dumps(message, default=str) + b'\n'
+        else:
+            line = json.dumps(message, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        try:
+            with open(self.log_path, 'ab') as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to append conversation log {self.log_path}: {e}")
+
+    def read_messages(self, offset: int = 0, limit: int = 50) -> List[Dict]:
+        """Read a page of the full conversation from the log file"""
+        if self.log_path is None:
+            return list(self.conversation_history)[offset:offset + limit]
+        try:
+            with open(self.log_path, 'rb') as f:
+                lines = islice(f, offset, offset + limit)
+                return [json.loads(line) for line in lines]
+        except FileNotFoundError:
+            return []
 
 
 class PhoneAgentWeb:
@@ -261,28 +713,87 @@ class PhoneAgentWeb:
 
         # Create Flask app
         self.app = Flask(__name__)
-        self.app.secret_key = os.urandom(24)
+        # A stable key keeps session cookies valid across restarts and workers
+        self.app.secret_key = (
+            os.getenv('FLASK_SECRET_KEY')
+            or self._load_or_create_secret(Path(__file__).parent / '.secret_key')
+        )
+        if ORJSON_AVAILABLE:
+            self.app.json = OrjsonJSONProvider(self.app)
 
         # Configure upload folders
         self.app.config['UPLOAD_FOLDER'] = Path(__file__).parent / 'static' / 'uploads'
         self.app.config['SCREENSHOTS_FOLDER'] = Path(__file__).parent / 'static' / 'screenshots'
         self.app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+        # Behind nginx/Apache (mod_xsendfile) let the front-end server stream files via sendfile(2)
+        self.app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+        # nginx only: internal location that aliases the screenshots folder (e.g. /internal-screenshots/)
+        self.app.config['SCREENSHOT_ACCEL_PREFIX'] = os.getenv('SCREENSHOT_ACCEL_PREFIX', '')
 
         # Create directories
         self.app.config['UPLOAD_FOLDER'].mkdir(exist_ok=True)
         self.app.config['SCREENSHOTS_FOLDER'].mkdir(exist_ok=True)
+        # One append-only JSONL conversation log per session
+        self.conversation_log_dir = Path(
+            os.getenv('CONVERSATION_LOG_DIR', Path(__file__).parent / 'conversation_logs')
+        )
+        self.conversation_log_dir.mkdir(parents=True, exist_ok=True)
+
+        # Transports accepted by SocketIO; websocket-only avoids long-polling request churn.
+        # Set SOCKETIO_TRANSPORTS=polling,websocket for clients/proxies without websocket support
+        self.socketio_transports = [
+            t.strip() for t in os.getenv('SOCKETIO_TRANSPORTS', 'websocket').split(',') if t.strip()
+        ]
 
         # Initialize SocketIO with more robust configuration
         self.socketio = SocketIO(
             self.app,
             cors_allowed_origins="*",
-            ping_timeout=5000,
-            ping_interval=25000,
-            engineio_logger=True
+            async_mode=SOCKETIO_ASYNC_MODE,
+            transports=self.socketio_transports,
+            # Engine.IO takes these in seconds
+            ping_timeout=20,
+            ping_interval=25,
+            # Per-packet logging is for debugging only; it formats a line for every frame
+            logger=self.debug,
+            engineio_logger=self.debug,
+            json=OrjsonSocketIOJSON if ORJSON_AVAILABLE else json
         )
 
+        # Bounded worker pool for agent tasks instead of one thread per send_task.
+        # Agent runs are long and mostly wait on the model/device, so size this for
+        # concurrent tasks rather than CPU count (PA_MAX_WORKERS is the older name)
+        self.max_concurrent_tasks = int(
+            os.getenv('AGENT_MAX_CONCURRENT_TASKS') or os.getenv('PA_MAX_WORKERS', 16)
+        )
+        self.task_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_tasks,
+            thread_name_prefix='pa-task'
+        )
+        # Running + queued tasks admitted at once; send_task is rejected beyond this
+        self.max_pending_tasks = int(os.getenv('PA_MAX_PENDING_TASKS', self.max_concurrent_tasks * 2))
+        self._task_slots = threading.BoundedSemaphore(self.max_pending_tasks)
+        # task_id -> Future, so a task that is still queued can be cancelled outright
+        self._task_futures: Dict[str, Future] = {}
+        # Small pool for post-task I/O (script saving) so it doesn't hold up completion events
+        self.io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pa-io')
+
+        # Shared script manager (one Supabase client for all /api/scripts requests)
+        self._script_manager = None
+        self._script_manager_warned = False
+
         # Storage
         self.sessions: Dict[str, TaskSession] = {}
+        # Serialized task dicts keyed by (view, task_id, last_activity, status); bounded LRU
+        self._task_repr_cache: 'OrderedDict[Tuple, Dict]' = OrderedDict()
+        self._task_repr_lock = threading.Lock()
+        # step_update payloads waiting to be emitted as one step_batch per session
+        self._pending_steps: Dict[str, List[Dict]] = defaultdict(list)
+        self._pending_steps_lock = threading.Lock()
+        # Sessions with a batch-window timer pending (at most one timer per session)
+        self._step_flush_scheduled: Set[str] = set()
+        # task_id -> cancellation flag of each task that is queued or running
+        self._cancel_events: Dict[str, threading.Event] = {}
         self.agent_configs: Dict[str, Any] = {
             'default': {
                 'base_url': os.getenv('PHONE_AGENT_BASE_URL', 'http://localhost:8000/v1'),
@@ -296,9 +807,10 @@ class PhoneAgentWeb:
                 'script_output_dir': 'web_scripts'
             }
         }
-
-        # Setup logger
-        self.logger = logging.getLogger(__name__)
+        # (body, etag) of the serialized agent_configs; reset whenever a config is updated
+        self._config_cache: Optional[Tuple[bytes, str]] = None
+        # Mixed into list ETags so a restart (version counter back at 0) never matches a cached copy
+        self._etag_salt = secrets.token_hex(4)
 
         # Setup custom template filters
         self.setup_template_filters()
@@ -317,8 +829,8 @@ class PhoneAgentWeb:
                 return ""
             if isinstance(value, str):
                 try:
-                    value = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                except:
+                    value = parse_iso_datetime(value)
+                except ValueError:
                     return value
             return value.strftime(format)
 
@@ -329,8 +841,10 @@ class PhoneAgentWeb:
         def add_header(response):
             """Add headers to disable caching for development"""
             # 禁用浏览器缓存，确保使用最新的JavaScript代码
-            if 'Cache-Control' not in response.headers:
-                response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            # 视图已显式设置缓存策略（如截图文件）时保持不变
+            if 'Cache-Control' in response.headers:
+                return response
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             if 'Pragma' not in response.headers:
                 response.headers['Pragma'] = 'no-cache'
             if 'Expires' not in response.headers:
@@ -340,7 +854,7 @@ class PhoneAgentWeb:
         @self.app.route('/')
         def index():
             """Main page"""
-            return render_template('index.html')
+            return render_template('index.html', socketio_transports=self.socketio_transports)
 
         @self.app.route('/config')
         def config():
@@ -354,11 +868,13 @@ class PhoneAgentWeb:
             user_id = request.json.get('user_id', 'anonymous')
 
             # Create session
+            now = datetime.now()
             task_session = TaskSession(
                 session_id=session_id,
                 user_id=user_id,
-                created_at=datetime.now(),
-                last_activity=datetime.now()
+                created_at=now,
+                last_activity=now,
+                log_path=self.conversation_log_dir / f"{session_id}.jsonl"
             )
 
             self.sessions[session_id] = task_session
@@ -382,20 +898,44 @@ class PhoneAgentWeb:
                 'last_activity': session_data.last_activity.isoformat(),
                 'current_task': session_data.current_task,
                 'task_status': session_data.task_status,
-                'conversation_count': len(session_data.conversation_history)
+                'conversation_count': session_data.message_count
             })
 
-        @self.app.route('/api/config', methods=['GET', 'POST'])
-        def handle_config():
-            """Get or update configuration"""
-            if request.method == 'GET':
-                return jsonify(self.agent_configs)
+        @self.app.route('/api/sessions/<session_id>/history', methods=['GET'])
+        def get_session_history(session_id):
+            """Get a page of the session's conversation history"""
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return jsonify({'error': 'Session not found'}), 404
+
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+            return json_response({
+                'session_id': session_id,
+                'messages': session_data.read_messages(offset, limit),
+                'offset': offset,
+                'limit': limit,
+                'total': session_data.message_count
+            })
 
-            # Update configuration
+        @self.app.route('/api/config', methods=['GET'])
+        def get_config():
+            """Get configuration (304 when the client's copy is current)"""
+            body, etag = self._config_body()
+            response = self.app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            # Revalidate on every use (instead of the global no-store) so the ETag is reused
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+
+        @self.app.route('/api/config', methods=['POST'])
+        def update_config():
+            """Update configuration"""
             config_data = request.json
             config_name = config_data.get('name', 'default')
 
             self.agent_configs[config_name] = config_data
+            self._config_cache = None
 
             return jsonify({'message': 'Configuration updated'})
 
@@ -403,8 +943,7 @@ class PhoneAgentWeb:
         def list_devices():
             """List available devices"""
             try:
-                from phone_agent.adb import list_devices
-                devices = list_devices()
+                devices = adb_list_devices()
                 return jsonify([{
                     'device_id': d.device_id,
                     'connection_type': d.connection_type.value,
@@ -415,41 +954,62 @@ class PhoneAgentWeb:
 
         @self.app.route('/api/apps', methods=['GET'])
         def list_apps():
-            """List supported apps"""
-            try:
-                from phone_agent.config.apps import APP_PACKAGES
-                return jsonify(list(APP_PACKAGES.keys()))
-            except Exception as e:
-                return jsonify({'error': str(e)}), 500
+            """List supported apps (pre-encoded; 304 when the client's copy is current)"""
+            response = Response(APP_NAMES_JSON, mimetype='application/json')
+            response.set_etag(APP_NAMES_ETAG)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
 
         @self.app.route('/screenshots/<path:filename>')
         def serve_screenshot(filename):
             """Serve screenshot files with Supabase fallback"""
-            # First try local file
-            local_path = os.path.join(self.app.config['SCREENSHOTS_FOLDER'], filename)
-            if os.path.exists(local_path):
-                return send_from_directory(self.app.config['SCREENSHOTS_FOLDER'], filename)
+            accel_prefix = self.app.config['SCREENSHOT_ACCEL_PREFIX']
+            if accel_prefix:
+                if safe_join('.', filename) is None:
+                    abort(404)
+                # nginx streams the file itself with sendfile(2); it answers 404 for missing files
+                response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + url_quote(filename)
+                response.cache_control.public = True
+                response.cache_control.max_age = self.SCREENSHOT_MAX_AGE
+                response.cache_control.immutable = True
+                return response
+
+            # First try local file; send_from_directory does the (single) existence check
+            try:
+                response = send_from_directory(
+                    self.app.config['SCREENSHOTS_FOLDER'], filename,
+                    conditional=True, max_age=self.SCREENSHOT_MAX_AGE
+                )
+            except NotFound:
+                pass
+            else:
+                # Screenshot names are unique per capture and never rewritten
+                response.cache_control.immutable = True
+                return response
 
             # If not found locally, try to fetch from Supabase Storage
             # This would require additional implementation
-            from flask import abort
             abort(404, description="Screenshot not found locally and Supabase fallback not implemented")
 
         @self.app.route('/uploads/<path:filename>')
         def serve_upload(filename):
             """Serve uploaded files"""
-            return send_from_directory(self.app.config['UPLOAD_FOLDER'], filename)
+            return send_from_directory(
+                self.app.config['UPLOAD_FOLDER'], filename,
+                conditional=True, max_age=self.STATIC_FILE_MAX_AGE
+            )
 
         @self.app.route('/api/health', methods=['GET'])
         def health_check():
             """健康检查端点"""
             try:
-                # 检查数据库连接
-                task_count = len(global_task_manager.get_all_tasks())
+                # 检查数据库连接（只查询任务数量，不加载任务列表）
+                task_count = global_task_manager.count_tasks()
 
-                return jsonify({
+                return json_response({
                     'status': 'healthy',
-                    'timestamp': datetime.now().isoformat() + 'Z',
+                    'timestamp': datetime.now(),
                     'service': 'phone-agent-web',
                     'database': {
                         'status': 'connected',
@@ -458,77 +1018,88 @@ class PhoneAgentWeb:
                 })
             except Exception as e:
                 logger.error(f"健康检查失败: {e}")
-                return jsonify({
+                return json_response({
                     'status': 'unhealthy',
                     'error': str(e),
-                    'timestamp': datetime.now().isoformat() + 'Z'
-                }), 500
+                    'timestamp': datetime.now()
+                }, 500)
 
         @self.app.route('/api/tasks', methods=['GET'])
         def get_tasks():
             """Get all tasks"""
             try:
-                logger.info(f"API请求: 获取任务列表, 参数: {dict(request.args)}")
+                # Polled constantly: per-request chatter is debug-level and only formatted when enabled
+                debug_enabled = logger.isEnabledFor(logging.DEBUG)
+                if debug_enabled:
+                    logger.debug("API请求: 获取任务列表, 参数: %s", dict(request.args))
 
                 session_id = request.args.get('session_id')
+                etag = self._task_list_etag(session_id or 'all')
+                if etag and request.if_none_match.contains_weak(etag):
+                    # Nothing changed since the client's copy: skip building and encoding the list
+                    return self._not_modified(etag)
                 if session_id:
-                    logger.info(f"按会话ID过滤: {session_id}")
                     tasks = global_task_manager.get_tasks_by_session(session_id)
                 else:
-                    logger.info("获取所有任务")
                     tasks = global_task_manager.get_all_tasks()
-
-                logger.info(f"获取到 {len(tasks)} 个任务")
-
-                task_list = []
-                for i, task in enumerate(tasks):
-                    try:
-                        task_data = {
-                            'task_id': task.task_id,
-                            'session_id': task.session_id,
-                            'user_id': task.user_id,
-                            'task_description': task.task_description,
-                            'status': task.status,
-                            'start_time': task.created_at.isoformat() + 'Z',  # 确保UTC时间有Z后缀
-                            'end_time': task.end_time.isoformat() + 'Z' if task.end_time else None,
-                            'last_activity': task.last_activity.isoformat() + 'Z',
-                            'error_message': task.error_message,
-                            'result': task.result
-                        }
-                        task_list.append(task_data)
-
-                        if i < 3:  # 记录前3个任务详情
-                            logger.debug(f"任务样本 {i+1}: {task.task_id} - {task.status} - {task.task_description}")
-
-                    except Exception as task_error:
-                        logger.error(f"处理任务 {task.task_id} 时出错: {task_error}")
-                        # 继续处理其他任务
-                        continue
-
-                response_data = {
-                    'data': {
-                        'tasks': task_list,
-                        'total': len(task_list),
-                        'timestamp': datetime.now().isoformat() + 'Z'
-                    }
-                }
-
-                logger.info(f"成功返回 {len(task_list)} 个任务数据")
-                return jsonify(response_data)
+                logger.debug("获取到 %d 个任务 (会话: %s)", len(tasks), session_id or '全部')
+
+                timestamp = datetime.now()
+
+                def generate():
+                    # Encode tasks incrementally and send them in TASK_STREAM_CHUNK-sized pieces:
+                    # the whole list is never held as one JSON buffer, and the client starts reading early
+                    chunk = [b'{"data":{"tasks":[']
+                    chunk_size = 0
+                    sent = 0
+                    for i, task in enumerate(tasks):
+                        try:
+                            row = json_bytes(self._task_repr(task))
+                        except Exception as task_error:
+                            logger.error("处理任务 %s 时出错: %s", task.task_id, task_error)
+                            # 继续处理其他任务
+                            continue
+                        if debug_enabled and i < 3:  # 记录前3个任务详情
+                            logger.debug("任务样本 %d: %s - %s - %s", i + 1, task.task_id, task.status, task.task_description)
+                        if sent:
+                            chunk.append(b',')
+                        chunk.append(row)
+                        chunk_size += len(row)
+                        sent += 1
+                        if chunk_size >= self.TASK_STREAM_CHUNK:
+                            yield b''.join(chunk)
+                            chunk = []
+                            chunk_size = 0
+                    chunk.append(b'],"total":%d,"timestamp":%s}}' % (sent, json_bytes(timestamp)))
+                    yield b''.join(chunk)
+                    logger.debug("成功返回 %d 个任务数据", sent)
+
+                response = Response(stream_with_context(generate()), mimetype='application/json')
+                if etag:
+                    response.set_etag(etag, weak=True)
+                    response.cache_control.no_cache = True
+                return response
 
             except Exception as e:
-                logger.error(f"获取任务列表失败: {e}", exc_info=True)
+                logger.error("获取任务列表失败: %s", e, exc_info=True)
                 error_response = {
                     'error': f'Failed to fetch tasks: {str(e)}',
-                    'timestamp': datetime.now().isoformat() + 'Z'
+                    'timestamp': datetime.now()
                 }
-                return jsonify(error_response), 500
+                return json_response(error_response, 500)
 
         @self.app.route('/api/tasks/<task_id>/stop', methods=['POST'])
         def stop_task(task_id):
             """Stop a running task"""
+            future = self._task_futures.get(task_id)
+            if future is not None and future.cancel():
+                # Still queued: it never started, so there is nothing else to stop
+                return jsonify({'message': 'Task cancelled before it started'})
             success = global_task_manager.stop_task(task_id)
             if success:
+                cancel_event = self._cancel_events.get(task_id)
+                if cancel_event is not None:
+                    cancel_event.set()
                 return jsonify({'message': 'Task stopped successfully'})
             else:
                 return jsonify({'error': 'Task not found or cannot be stopped'}), 404
@@ -542,16 +1113,17 @@ class PhoneAgentWeb:
                 page = request.args.get('page', 1, type=int)
                 per_page = min(request.args.get('per_page', 20, type=int), 100)
 
-                # Get steps from database
-                steps = global_task_manager.get_task_steps(task_id, limit)
-
-                # Pagination
-                total_steps = len(steps)
+                # Pagination happens in the database; only the requested page is fetched
                 start_idx = (page - 1) * per_page
-                end_idx = start_idx + per_page
-                paginated_steps = steps[start_idx:end_idx]
-
-                return jsonify({
+                page_size = per_page
+                if limit:
+                    # 'limit' caps the total number of steps exposed across all pages
+                    page_size = max(0, min(per_page, limit - start_idx))
+                paginated_steps, total_steps = global_task_manager.get_task_steps_page(task_id, start_idx, page_size)
+                if limit:
+                    total_steps = min(total_steps, limit)
+
+                return json_response({
                     'data': {
                         'steps': paginated_steps,
                         'pagination': {
@@ -569,35 +1141,36 @@ class PhoneAgentWeb:
         def get_task_report(task_id):
             """Generate task execution report"""
             try:
+                # ?include_steps=false: statistics only, computed from a narrow
+                # projection instead of shipping every step/screenshot row
+                if request.args.get('include_steps', 'true').lower() == 'false':
+                    task = global_task_manager.get_task(task_id)
+                    if not task:
+                        return jsonify({'error': 'Task not found'}), 404
+
+                    statistics = global_task_manager.get_task_statistics(task_id)
+                    statistics['screenshots_count'] = global_task_manager.count_step_screenshots(task_id)
+                    return json_response({'data': {'task': task.to_dict(), 'statistics': statistics}})
+
                 # Get report data
                 report_data = global_task_manager.get_step_report_data(task_id)
 
                 if not report_data['task']:
                     return jsonify({'error': 'Task not found'}), 404
 
-                # Calculate statistics
+                # Calculate statistics (one pass over the steps)
                 steps = report_data['steps']
-                total_steps = len(steps)
-                successful_steps = len([s for s in steps if s.get('success') is True])
-                failed_steps = total_steps - successful_steps
-                total_duration = sum(s.get('duration_ms') or 0 for s in steps)
+                statistics = global_task_manager.summarize_steps(steps)
+                statistics['screenshots_count'] = len(report_data['screenshots'])
 
                 report = {
                     'task': report_data['task'],
                     'steps': steps,
                     'screenshots': report_data['screenshots'],
-                    'statistics': {
-                        'total_steps': total_steps,
-                        'successful_steps': successful_steps,
-                        'failed_steps': failed_steps,
-                        'success_rate': successful_steps / max(total_steps, 1),
-                        'total_duration_ms': total_duration,
-                        'average_step_duration_ms': total_duration / max(total_steps, 1),
-                        'screenshots_count': len(report_data['screenshots'])
-                    }
+                    'statistics': statistics
                 }
 
-                return jsonify({'data': report})
+                return json_response({'data': report})
             except Exception as e:
                 return jsonify({'error': f'Failed to generate task report: {str(e)}'}), 500
 
@@ -605,17 +1178,24 @@ class PhoneAgentWeb:
         def get_task_screenshots(task_id):
             """Get all screenshots for a task"""
             try:
-                screenshots = global_task_manager.get_step_screenshots(task_id)
+                # Badge-style callers only need per-step counts, not the full rows
+                if request.args.get('counts_only', 'false').lower() == 'true':
+                    counts = global_task_manager.count_screenshots_by_step(task_id)
+                    return json_response({
+                        'data': {
+                            'counts_by_step': counts,
+                            'total_count': sum(counts.values())
+                        }
+                    })
 
-                # Group screenshots by step
-                screenshots_by_step = {}
-                for screenshot in screenshots:
-                    step_id = screenshot.get('step_id')
-                    if step_id not in screenshots_by_step:
-                        screenshots_by_step[step_id] = []
-                    screenshots_by_step[step_id].append(screenshot)
+                # Rows arrive ordered by step, so grouping is a single streaming pass
+                screenshots = global_task_manager.get_step_screenshots(task_id, order_by_step=True)
+                screenshots_by_step = {
+                    step_id: list(group)
+                    for step_id, group in groupby(screenshots, key=itemgetter('step_id'))
+                }
 
-                return jsonify({
+                return json_response({
                     'data': {
                         'screenshots': screenshots,
                         'grouped_by_step': screenshots_by_step,
@@ -650,8 +1230,15 @@ class PhoneAgentWeb:
 
                 # Get statistics from SupabaseTaskManager
                 if hasattr(global_task_manager, 'get_statistics'):
+                    etag = self._statistics_etag()
+                    if etag and request.if_none_match.contains_weak(etag):
+                        return self._not_modified(etag)
                     stats = global_task_manager.get_statistics()
-                    return jsonify(stats)
+                    response = json_response(stats)
+                    if etag:
+                        response.set_etag(etag, weak=True)
+                        response.cache_control.no_cache = True
+                    return response
                 else:
                     return jsonify({'error': 'Statistics not available'}), 503
 
@@ -695,7 +1282,7 @@ class PhoneAgentWeb:
                             'period_days': days
                         }
 
-                return jsonify(summary)
+                return json_response(summary)
 
             except Exception as e:
                 logger.error(f"Error getting task summary: {e}")
@@ -707,21 +1294,9 @@ class PhoneAgentWeb:
             try:
                 task = global_task_manager.get_task(task_id)
                 if task:
-                    return jsonify({
+                    return json_response({
                         'data': {
-                            'task': {
-                                'task_id': task.task_id,
-                                'session_id': task.session_id,
-                                'user_id': task.user_id,
-                                'task_description': task.task_description,
-                                'status': task.status,
-                                'start_time': task.created_at.isoformat(),  # 映射为前端期望的字段名
-                                'end_time': task.end_time.isoformat() if task.end_time else None,
-                                'last_activity': task.last_activity.isoformat(),
-                                'error_message': task.error_message,
-                                'result': task.result,
-                                'config': task.config
-                            }
+                            'task': self._task_repr(task, detail=True)
                         }
                     })
                 else:
@@ -734,12 +1309,10 @@ class PhoneAgentWeb:
         def get_scripts():
             """Get scripts with optional search and filtering"""
             try:
-                if not SCRIPT_MANAGER_AVAILABLE:
+                script_manager = self.script_manager
+                if script_manager is None:
                     return jsonify({'error': 'Script management not available'}), 503
 
-                # Initialize script manager
-                script_manager = ScriptManager()
-
                 # Get query parameters
                 keyword = request.args.get('keyword', '')
                 device_id = request.args.get('device_id', '')
@@ -771,7 +1344,7 @@ class PhoneAgentWeb:
                         'created_at': script.created_at.isoformat() if script.created_at else None
                     })
 
-                return jsonify({'data': {'scripts': script_list}})
+                return json_response({'data': {'scripts': script_list}})
             except Exception as e:
                 return jsonify({'error': f'Failed to fetch scripts: {str(e)}'}), 500
 
@@ -779,11 +1352,13 @@ class PhoneAgentWeb:
         def get_script(script_id):
             """Get script details by ID"""
             try:
-                script_manager = ScriptManager()
+                script_manager = self.script_manager
+                if script_manager is None:
+                    return jsonify({'error': 'Script management not available'}), 503
                 script = script_manager.get_script(script_id)
 
                 if script:
-                    return jsonify({'data': script.to_dict()})
+                    return json_response({'data': script.to_dict()})
                 else:
                     return jsonify({'error': 'Script not found'}), 404
             except Exception as e:
@@ -793,26 +1368,29 @@ class PhoneAgentWeb:
         def export_script(script_id):
             """Export script in specified format"""
             try:
-                script_manager = ScriptManager()
+                script_manager = self.script_manager
+                if script_manager is None:
+                    return jsonify({'error': 'Script management not available'}), 503
                 format_type = request.args.get('format', 'json').lower()
 
                 if format_type not in ['json', 'python']:
                     return jsonify({'error': 'Invalid format. Supported formats: json, python'}), 400
 
-                script_content = script_manager.export_script(script_id, format_type)
+                # JSON is encoded step by step and streamed, never held as one string
+                chunks = script_manager.export_script_iter(script_id, format_type, self.TASK_STREAM_CHUNK)
 
-                if script_content is None:
+                if chunks is None:
                     return jsonify({'error': 'Script not found'}), 404
 
                 if format_type == 'json':
                     return Response(
-                        script_content,
+                        stream_with_context(chunks),
                         mimetype='application/json',
                         headers={'Content-Disposition': f'attachment; filename=script_{script_id}.json'}
                     )
                 else:  # python
                     return Response(
-                        script_content,
+                        stream_with_context(chunks),
                         mimetype='text/x-python',
                         headers={'Content-Disposition': f'attachment; filename=replay_script_{script_id}.py'}
                     )
@@ -823,7 +1401,9 @@ class PhoneAgentWeb:
         def replay_script(script_id):
             """Initiate script replay"""
             try:
-                script_manager = ScriptManager()
+                script_manager = self.script_manager
+                if script_manager is None:
+                    return jsonify({'error': 'Script management not available'}), 503
                 script = script_manager.get_script(script_id)
 
                 if not script:
@@ -835,15 +1415,23 @@ class PhoneAgentWeb:
 
                 # For now, return the script data for client-side replay
                 # In future, this could trigger server-side replay
-                return jsonify({
+                head = json_bytes({
                     'message': 'Script replay initiated',
                     'script_id': script_id,
-                    'script_data': script.to_dict(),
                     'replay_params': {
                         'device_id': device_id,
                         'delay': delay
                     }
                 })
+
+                def generate():
+                    # The recorded steps are encoded one by one and streamed in chunks
+                    # rather than copied into one dict and serialized as a single buffer
+                    yield head[:-1] + b',"script_data":'
+                    yield from script.iter_json(self.TASK_STREAM_CHUNK)
+                    yield b'}'
+
+                return Response(stream_with_context(generate()), mimetype='application/json')
             except Exception as e:
                 return jsonify({'error': f'Failed to initiate script replay: {str(e)}'}), 500
 
@@ -851,7 +1439,9 @@ class PhoneAgentWeb:
         def delete_script(script_id):
             """Delete script (soft delete)"""
             try:
-                script_manager = ScriptManager()
+                script_manager = self.script_manager
+                if script_manager is None:
+                    return jsonify({'error': 'Script management not available'}), 503
                 success = script_manager.delete_script(script_id, soft_delete=True)
 
                 if success:
@@ -865,7 +1455,9 @@ class PhoneAgentWeb:
         def get_script_summary():
             """Get script summary statistics"""
             try:
-                script_manager = ScriptManager()
+                script_manager = self.script_manager
+                if script_manager is None:
+                    return jsonify({'error': 'Script management not available'}), 503
                 limit = int(request.args.get('limit', 100))
                 summary = script_manager.get_script_summary(limit=limit)
 
@@ -877,9 +1469,10 @@ class PhoneAgentWeb:
         @self.app.route('/api/config/screenshot-fallback', methods=['GET'])
         def get_screenshot_fallback_config():
             """Get screenshot fallback configuration"""
+            if not LOCAL_FILE_SCANNER_AVAILABLE:
+                return jsonify({'error': 'Screenshot fallback not available'}), 503
             try:
-                from supabase_manager import LocalFileScanner
-                scanner = LocalFileScanner()
+                scanner = get_local_file_scanner()
 
                 config_data = {
                     'config': scanner.config,
@@ -894,19 +1487,19 @@ class PhoneAgentWeb:
         @self.app.route('/api/config/screenshot-fallback', methods=['POST'])
         def update_screenshot_fallback_config():
             """Update screenshot fallback configuration"""
+            if not LOCAL_FILE_SCANNER_AVAILABLE:
+                return jsonify({'error': 'Screenshot fallback not available'}), 503
             try:
-                from supabase_manager import LocalFileScanner
-                scanner = LocalFileScanner()
+                scanner = get_local_file_scanner()
 
                 new_config = request.json.get('config', {})
                 if not isinstance(new_config, dict):
                     return jsonify({'error': 'Invalid config format'}), 400
 
-                # Validate configuration values
-                valid_keys = scanner.config.keys()
-                for key, value in new_config.items():
-                    if key not in valid_keys:
-                        return jsonify({'error': f'Invalid config key: {key}'}), 400
+                # Validate configuration keys (all unknown keys are reported at once)
+                invalid_keys = new_config.keys() - scanner.CONFIG_KEYS
+                if invalid_keys:
+                    return jsonify({'error': f'Invalid config keys: {", ".join(sorted(invalid_keys))}'}), 400
 
                 # Update configuration
                 scanner.update_config(new_config)
@@ -918,9 +1511,10 @@ class PhoneAgentWeb:
         @self.app.route('/api/config/screenshot-fallback/clear-cache', methods=['POST'])
         def clear_screenshot_cache():
             """Clear screenshot scan cache"""
+            if not LOCAL_FILE_SCANNER_AVAILABLE:
+                return jsonify({'error': 'Screenshot fallback not available'}), 503
             try:
-                from supabase_manager import LocalFileScanner
-                scanner = LocalFileScanner()
+                scanner = get_local_file_scanner()
                 scanner.clear_cache()
 
                 return jsonify({'message': 'Screenshot cache cleared successfully'})
@@ -930,12 +1524,11 @@ class PhoneAgentWeb:
         @self.app.route('/api/config/screenshot-fallback/test', methods=['POST'])
         def test_screenshot_fallback():
             """Test screenshot fallback functionality"""
+            if not LOCAL_FILE_SCANNER_AVAILABLE:
+                return jsonify({'error': 'Screenshot fallback not available'}), 503
             try:
-                from supabase_manager import LocalFileScanner, SupabaseManager
-                import time
-
                 test_start_time = time.time()
-                scanner = LocalFileScanner()
+                scanner = get_local_file_scanner()
 
                 # Test if scanner is enabled
                 if not scanner.is_enabled():
@@ -979,12 +1572,12 @@ class PhoneAgentWeb:
         @self.socketio.on('connect')
         def handle_connect():
             """Handle client connection"""
-            print(f"Client connected: {request.sid}")
+            logger.info("Client connected: %s", request.sid)
 
         @self.socketio.on('disconnect')
         def handle_disconnect():
             """Handle client disconnection"""
-            print(f"Client disconnected: {request.sid}")
+            logger.info("Client disconnected: %s", request.sid)
 
         @self.socketio.on('join_session')
         def handle_join_session(data):
@@ -1009,13 +1602,40 @@ class PhoneAgentWeb:
                 emit('error', {'message': 'Invalid session_id'})
                 return
 
-            # Execute task asynchronously
-            thread = threading.Thread(
-                target=self._execute_task_thread,
-                args=(session_id, task_description, config, request.sid)
+            # Backpressure: refuse new work instead of letting the pool queue grow without bound
+            if not self._task_slots.acquire(blocking=False):
+                emit('error', {'message': 'Server is busy, please retry later'})
+                return
+
+            # Execute task asynchronously on the worker pool
+            task_id = str(uuid.uuid4())
+            # Registered by task_id so the REST stop route also reaches a task that is still queued;
+            # the session only points at it once a worker starts the task (see _execute_task_thread)
+            self._cancel_events[task_id] = threading.Event()
+            future = self._task_futures[task_id] = self.task_executor.submit(
+                self._execute_task_thread,
+                session_id, task_description, config, request.sid, task_id
+            )
+
+            def task_done(_):
+                self._task_slots.release()
+                self._task_futures.pop(task_id, None)
+                self._cancel_events.pop(task_id, None)
+                if global_task_manager:
+                    global_task_manager.unregister_thread(task_id)
+
+            if global_task_manager:
+                global_task_manager.register_thread(task_id, future)
+            future.add_done_callback(task_done)
+
+            # Pool usage, so operators can tell whether AGENT_MAX_CONCURRENT_TASKS is the bottleneck
+            admitted = list(self._task_futures.values())
+            running = sum(1 for f in admitted if f.running())
+            logger.info(
+                "Task %s admitted: %d/%d workers busy, %d queued, %d/%d slots used",
+                task_id, running, self.max_concurrent_tasks, len(admitted) - running,
+                len(admitted), self.max_pending_tasks
             )
-            thread.daemon = True
-            thread.start()
 
         @self.socketio.on('stop_task')
         def handle_stop_task(data):
@@ -1025,11 +1645,16 @@ class PhoneAgentWeb:
             if session_id in self.sessions:
                 session_data = self.sessions[session_id]
 
-                # Update session status
+                # Update session status; cancel the task that is running in this session,
+                # not one queued behind it (task_id is set when a worker starts a task)
                 session_data.task_status = 'stopped'
+                if session_data.task_id is not None:
+                    cancel_event = self._cancel_events.get(session_data.task_id)
+                    if cancel_event is not None:
+                        cancel_event.set()
 
                 # Stop the agent directly if available
-                if hasattr(session_data, 'agent') and session_data.agent:
+                if session_data.agent is not None:
                     try:
                         logger.info(f"🛑 Stopping agent for session {session_id}")
                         session_data.agent.stop(
@@ -1037,12 +1662,10 @@ class PhoneAgentWeb:
                             message="Task stopped by user via web interface"
                         )
                     except Exception as e:
-                        logger.error(f"Error stopping agent: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        logger.error(f"Error stopping agent: {e}", exc_info=True)
 
                 # Update database task status if task_id exists
-                if hasattr(session_data, 'task_id') and session_data.task_id:
+                if session_data.task_id is not None:
                     try:
                         global_task_manager.update_task_status(session_data.task_id, 'stopped')
                     except Exception as e:
@@ -1053,13 +1676,23 @@ class PhoneAgentWeb:
                     'message': 'Task stopped by user'
                 }, room=session_id)
 
-    def _execute_task_thread(self, session_id: str, task_description: str, config: Dict, client_sid: str):
-        """Execute task in separate thread"""
-        # Generate unique task ID
-        task_id = str(uuid.uuid4())
+    def _execute_task_thread(self, session_id: str, task_description: str, config: Dict, client_sid: str,
+                             task_id: Optional[str] = None):
+        """Execute task in a worker thread"""
+        # Generate unique task ID unless the dispatcher already assigned one
+        task_id = task_id or str(uuid.uuid4())
+        # Bound before the try so the error handler can tell whether the agent was created
+        agent: Optional[PhoneAgent] = None
 
         try:
             session_data = self.sessions[session_id]
+            cancel_event = self._cancel_events.setdefault(task_id, threading.Event())
+            if cancel_event.is_set():
+                # Stopped while waiting in the pool queue
+                return
+            # From here on this is the session's running task: stop_task targets it
+            session_data.cancel_event = cancel_event
+            session_data.task_id = task_id
 
             # Create global task
             global_task = global_task_manager.create_task(
@@ -1073,7 +1706,6 @@ class PhoneAgentWeb:
             # Update session
             session_data.current_task = task_description
             session_data.last_activity = datetime.now()
-            session_data.task_id = task_id  # Store task ID in session
 
             # Create agent config
             agent_config = self._create_agent_config(config)
@@ -1104,27 +1736,44 @@ class PhoneAgentWeb:
             session_data.agent = agent
             session_data.task_status = 'running'
 
-            # Notify start
+            # Notify start (one timestamp for the event and the conversation entry)
+            started_at = datetime.now().isoformat()
             self.socketio.emit('task_started', {
                 'session_id': session_id,
                 'task': task_description,
                 'task_id': task_id,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': started_at
             }, room=session_id)
 
             # Add to conversation history
-            session_data.conversation_history.append({
+            session_data.record_message({
                 'role': 'user',
                 'content': task_description,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': started_at
             })
 
+            # Bound once per task: the callback below runs for every agent step
+            serialize_action = self._serialize_action
+            serialize_result = self._serialize_result
+            queue_step_update = self._queue_step_update
+            # Resolve step persistence once per task instead of probing on every step
+            enqueue_step = getattr(global_task_manager, 'enqueue_step', None) if SUPABASE_AVAILABLE else None
+            enqueue_step_screenshot = getattr(global_task_manager, 'enqueue_step_screenshot', None)
+            if enqueue_step is None:
+                logger.warning(f"⚠️ Step saving not available for task {task_id}. SUPABASE_AVAILABLE: {SUPABASE_AVAILABLE}")
+                if not SUPABASE_AVAILABLE:
+                    logger.warning("Supabase is not available - check environment variables and connection")
+                else:
+                    logger.warning("global_task_manager does not have enqueue_step method")
+
             # Custom step callback for real-time updates
             def step_callback(step_data):
                 """Callback for each step"""
-                # Check if task was stopped
-                global_task_info = global_task_manager.get_task(task_id)
-                if global_task_info and global_task_info.status == 'stopped':
+                # One timestamp per step, shared by the DB records and the emitted update
+                step_time = datetime.now().isoformat()
+
+                # Check if task was stopped (set by the stop handlers, no task lookup per step)
+                if cancel_event.is_set():
                     raise Exception("Task stopped by user")
 
                 # Verify task_id consistency
@@ -1133,217 +1782,259 @@ class PhoneAgentWeb:
                 if step_task_id and step_task_id != web_task_id:
                     logger.warning(f"⚠️ Task ID mismatch: Web={web_task_id}, Step={step_task_id}")
                 else:
-                    logger.info(f"✅ Task ID consistent: {web_task_id}")
+                    logger.debug("✅ Task ID consistent: %s", web_task_id)
 
-                # Save step to database if Supabase is available
-                logger.info(f"Step callback triggered - SUPABASE_AVAILABLE: {SUPABASE_AVAILABLE}, has_save_step: {hasattr(global_task_manager, 'save_step')}")
+                # Convert non-serializable objects and push the UI update before any
+                # persistence work, so the client never waits on the database records below.
+                # The result is serialized once and shared with the database record.
+                step_result = serialize_result(step_data.get('result'))
+                serializable_step = {
+                    'step_number': step_data.get('step_number'),
+                    'thinking': step_data.get('thinking'),
+                    'action': serialize_action(step_data.get('action')),
+                    'result': step_result,
+                    'screenshot': step_data.get('screenshot'),
+                    'success': step_data.get('success'),
+                    'finished': step_data.get('finished')
+                }
 
-                if SUPABASE_AVAILABLE and hasattr(global_task_manager, 'save_step'):
+                queue_step_update(session_id, {
+                    'session_id': session_id,
+                    'step': serializable_step,
+                    'task_id': task_id,
+                    'timestamp': step_time
+                })
+
+                # Save step to database if Supabase is available
+                if enqueue_step is not None:
                     try:
-                        logger.info(f"💾 Attempting to save step {step_data.get('step_number')} to database")
+                        logger.debug("💾 Attempting to save step %s to database", step_data.get('step_number'))
 
                         # Prepare step record for database
                         step_record = {
-                            # 'id' will be auto-generated by database
                             'task_id': step_data.get('task_id'),
                             'step_number': step_data.get('step_number'),
                             'step_type': 'completion' if step_data.get('finished') else 'action',
                             'step_data': {
                                 'action': step_data.get('action'),
-                                'result': self._serialize_result(step_data.get('result'))
+                                'result': step_result
                             },
                             'thinking': step_data.get('thinking'),
-                            'action_result': self._serialize_result(step_data.get('result')),
+                            'action_result': step_result,
                             'screenshot_path': step_data.get('screenshot_path'),
                             'success': step_data.get('success'),
-                            'created_at': datetime.now().isoformat()
+                            'created_at': step_time
                         }
 
-                        # Save step to task_steps table
-                        saved_step_id = global_task_manager.save_step(step_record)
-
-                        if saved_step_id:
-                            logger.info(f"✅ Step {step_data.get('step_number')} saved successfully with ID: {saved_step_id}")
-                        else:
-                            logger.error(f"❌ Failed to save step {step_data.get('step_number')} - no ID returned")
+                        # Queue step for the batched task_steps writer; the ID is generated client-side
+                        saved_step_id = enqueue_step(step_record)
+                        logger.debug("✅ Step %s queued for saving with ID: %s", step_data.get('step_number'), saved_step_id)
 
-                        # Save screenshot information to step_screenshots table
+                        # Save screenshot information to step_screenshots table; size and hash
+                        # come from the agent's write (the background writer fills them otherwise)
                         screenshot_path = step_data.get('screenshot_path')
-                        if screenshot_path and os.path.exists(screenshot_path) and saved_step_id:
-                            logger.info(f"📸 Saving screenshot: {screenshot_path}")
-
+                        if screenshot_path and saved_step_id:
                             screenshot_record = {
-                                'id': str(uuid.uuid4()),
                                 'task_id': step_data.get('task_id'),
-                                'step_id': saved_step_id,  # Use the returned step ID
+                                'step_id': saved_step_id,  # Client-generated step ID
                                 'screenshot_path': screenshot_path,
-                                'file_size': get_file_size(screenshot_path),
-                                'file_hash': calculate_file_hash(screenshot_path),
+                                'file_size': step_data.get('screenshot_size'),
+                                'file_hash': step_data.get('screenshot_hash'),
                                 'compressed': False,
-                                'created_at': datetime.now().isoformat()
+                                'created_at': step_time
                             }
 
-                            saved_screenshot_id = global_task_manager.save_step_screenshot(screenshot_record)
-
-                            if saved_screenshot_id:
-                                logger.info(f"✅ Screenshot saved successfully with ID: {saved_screenshot_id}")
-                            else:
-                                logger.error(f"❌ Failed to save screenshot")
-
-                            if agent_config.get('verbose', False):
-                                print(f"💾 Saved step {step_data.get('step_number')} to database")
-                        elif screenshot_path:
-                            if not os.path.exists(screenshot_path):
-                                logger.warning(f"⚠️ Screenshot file not found: {screenshot_path}")
-                            else:
-                                logger.warning(f"⚠️ No step_id returned, skipping screenshot save")
+                            screenshot_id = enqueue_step_screenshot(screenshot_record)
+                            logger.debug("✅ Screenshot queued for saving with ID: %s", screenshot_id)
 
                     except Exception as db_error:
                         # Log error but don't interrupt task execution
-                        error_msg = f"⚠️ Failed to save step to database: {db_error}"
-                        print(error_msg)
-                        logger.error(f"Step database save error: {db_error}")
-                        logger.exception("Full traceback:")
-                else:
-                    logger.warning(f"⚠️ Step saving not available. SUPABASE_AVAILABLE: {SUPABASE_AVAILABLE}, has_save_step: {hasattr(global_task_manager, 'save_step') if hasattr(global_task_manager, 'save_step') else 'global_task_manager missing save_step'}")
-                    if not SUPABASE_AVAILABLE:
-                        logger.warning("Supabase is not available - check environment variables and connection")
-                    if not hasattr(global_task_manager, 'save_step'):
-                        logger.warning("global_task_manager does not have save_step method")
-
-                # Convert non-serializable objects to serializable format
-                serializable_step = {
-                    'step_number': step_data.get('step_number'),
-                    'thinking': step_data.get('thinking'),
-                    'action': self._serialize_action(step_data.get('action')),
-                    'result': self._serialize_result(step_data.get('result')),
-                    'screenshot': step_data.get('screenshot'),
-                    'success': step_data.get('success'),
-                    'finished': step_data.get('finished')
-                }
-
-                self.socketio.emit('step_update', {
-                    'session_id': session_id,
-                    'step': serializable_step,
-                    'task_id': task_id,
-                    'timestamp': datetime.now().isoformat()
-                }, room=session_id)
+                        logger.exception("⚠️ Failed to save step to database: %s", db_error)
 
             # Execute task
             result = agent.run(task_description, step_callback=step_callback)
 
-            # Save script to database if recording was enabled
+            # Save script to database if recording was enabled (in the background, see script_ready)
             script_id = None
-            if agent_config.get('record_script', False) and hasattr(agent, 'recorder') and agent.recorder:
-                try:
-                    # Finish recording and save to database
-                    agent.recorder.finish_recording(success=True)
-                    script_id = agent.recorder.save_to_database_and_file()
-
-                    # Update global task with script_id
-                    if script_id:
-                        global_task_manager.update_task(task_id, script_id=script_id)
-                        print(f"Task {task_id} script saved with ID: {script_id}")
-                except Exception as script_error:
-                    print(f"Failed to save script to database: {script_error}")
-
-            # Update session and global task
+            if agent.recorder is not None:
+                recorder = agent.recorder
+                self._save_script_in_background(
+                    recorder, lambda: recorder.finish_recording(success=True), task_id, session_id
+                )
+
+            # Update session and global task (one clock read and result string for the whole block)
+            finished_at = datetime.now()
+            timestamp = finished_at.isoformat()
+            result_text = str(result)
             session_data.task_status = 'completed'
-            session_data.last_activity = datetime.now()
-            global_task_manager.update_task_status(task_id, 'completed', result=str(result))
+            session_data.last_activity = finished_at
+            global_task_manager.update_task_status(task_id, 'completed', result=result_text)
 
             # Add result to conversation
-            session_data.conversation_history.append({
+            session_data.record_message({
                 'role': 'assistant',
-                'content': str(result),
-                'timestamp': datetime.now().isoformat()
+                'content': result_text,
+                'timestamp': timestamp
             })
 
             # Notify completion
+            # Deliver any buffered steps before the terminal event
+            self._emit_pending_steps(session_id)
+            # Steps are written in the background: make sure they are stored
+            # before the client reacts to task_completed by loading the report
+            if hasattr(global_task_manager, 'flush_steps'):
+                global_task_manager.flush_steps()
             self.socketio.emit('task_completed', {
                 'session_id': session_id,
-                'result': str(result),
+                'result': result_text,
                 'task_id': task_id,
-                'script_id': script_id,  # Include script_id in response
-                'timestamp': datetime.now().isoformat()
+                'script_id': script_id,  # None here; delivered by script_ready once saved
+                'timestamp': timestamp
             }, room=session_id)
 
         except StopException as e:
             # Task was stopped by user
             logger.info(f"🛑 Task {task_id} stopped: {e}")
 
-            # Save script to database if recording was enabled
+            # Save script to database if recording was enabled (in the background, see script_ready)
             script_id = None
-            if agent_config.get('record_script', False) and hasattr(agent, 'recorder') and agent.recorder:
-                try:
-                    # Finish recording and save to database
-                    agent.recorder.stop()  # Stop recording
-                    script_id = agent.recorder.save_to_database_and_file()
-
-                    # Update global task with script_id
-                    if script_id:
-                        global_task_manager.update_task(task_id, script_id=script_id)
-                        print(f"Task {task_id} script saved with ID: {script_id}")
-                except Exception as script_error:
-                    print(f"Failed to save script to database: {script_error}")
+            if agent.recorder is not None:
+                self._save_script_in_background(agent.recorder, agent.recorder.stop, task_id, session_id)
 
             # Update session and global task status
+            stopped_at = datetime.now()
+            timestamp = stopped_at.isoformat()
+            stop_message = str(e)
             session_data.task_status = 'stopped'
-            session_data.last_activity = datetime.now()
-            global_task_manager.update_task_status(task_id, 'stopped', result=str(e))
+            session_data.last_activity = stopped_at
+            global_task_manager.update_task_status(task_id, 'stopped', result=stop_message)
 
             # Add result to conversation
-            session_data.conversation_history.append({
+            session_data.record_message({
                 'role': 'assistant',
-                'content': str(e),
-                'timestamp': datetime.now().isoformat()
+                'content': stop_message,
+                'timestamp': timestamp
             })
 
             # Notify stop completion
+            # Deliver any buffered steps before the terminal event
+            self._emit_pending_steps(session_id)
             self.socketio.emit('task_stopped', {
                 'session_id': session_id,
-                'result': str(e),
+                'result': stop_message,
                 'task_id': task_id,
                 'script_id': script_id,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp
             }, room=session_id)
 
         except Exception as e:
             # Save script to database even if task failed (if recording was enabled)
             script_id = None
-            try:
-                if 'agent_config' in locals() and agent_config.get('record_script', False) and 'agent' in locals() and hasattr(agent, 'recorder') and agent.recorder:
-                    # Finish recording with failure status
-                    agent.recorder.finish_recording(success=False)
-                    script_id = agent.recorder.save_to_database_and_file()
-
-                    # Update global task with script_id even for failed tasks
-                    if script_id:
-                        global_task_manager.update_task(task_id, script_id=script_id)
-                        print(f"Failed task {task_id} script saved with ID: {script_id}")
-            except Exception as script_error:
-                print(f"Failed to save script to database during error handling: {script_error}")
+            if agent is not None and agent.recorder is not None:
+                # Finish recording with failure status (in the background, see script_ready)
+                recorder = agent.recorder
+                self._save_script_in_background(
+                    recorder, lambda: recorder.finish_recording(success=False), task_id, session_id
+                )
 
             # Handle error
+            failed_at = datetime.now()
+            timestamp = failed_at.isoformat()
+            error_message = str(e)
             session_data.task_status = 'error'
-            session_data.last_activity = datetime.now()
-            global_task_manager.update_task_status(task_id, 'error', str(e))
+            session_data.last_activity = failed_at
+            global_task_manager.update_task_status(task_id, 'error', error_message)
 
-            error_message = str(e)
-            session_data.conversation_history.append({
+            session_data.record_message({
                 'role': 'assistant',
                 'content': f'Error: {error_message}',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp
             })
 
+            # Deliver any buffered steps before the terminal event
+            self._emit_pending_steps(session_id)
             self.socketio.emit('task_error', {
                 'session_id': session_id,
                 'error': error_message,
                 'task_id': task_id,
-                'script_id': script_id,  # Include script_id even for errors
-                'timestamp': datetime.now().isoformat()
+                'script_id': script_id,  # None here; delivered by script_ready once saved
+                'timestamp': timestamp
             }, room=session_id)
 
+    def _save_script_in_background(self, recorder, finish: Callable[[], Any], task_id: str, session_id: str):
+        """Finish and persist a recorded script off the completion path.
+
+        The terminal task event goes out right away with script_id=None; once the
+        script is stored the client gets a script_ready event carrying its ID.
+        """
+        def save():
+            try:
+                finish()
+                script_id = recorder.save_to_database_and_file()
+            except Exception as script_error:
+                logger.error("Failed to save script to database: %s", script_error, exc_info=True)
+                return
+            if script_id:
+                # Update global task with script_id
+                global_task_manager.update_task(task_id, script_id=script_id)
+                logger.info("Task %s script saved with ID: %s", task_id, script_id)
+            self.socketio.emit('script_ready', {
+                'session_id': session_id,
+                'task_id': task_id,
+                'script_id': script_id
+            }, room=session_id)
+
+        return self.io_executor.submit(save)
+
+    def _task_list_etag(self, scope: str) -> Optional[str]:
+        """ETag for a view derived from the task set, or None if the manager has no version"""
+        version = getattr(global_task_manager, 'version', None)
+        if version is None:
+            return None
+        return f"{self._etag_salt}-{version}-{scope}"
+
+    # Longest time (seconds) a /api/statistics ETag stays valid; bounds how stale a 304 can be
+    STATISTICS_ETAG_TTL = 15
+
+    def _statistics_etag(self) -> Optional[str]:
+        """ETag for /api/statistics, or None if the manager has no version
+
+        The task version and the step writer's batch count only see writes made by
+        this process; step rows from StepTracker/ScreenshotManager, other workers or
+        other hosts don't move them. The tag therefore also rolls over every
+        STATISTICS_ETAG_TTL seconds, so such writes show up within that window.
+        """
+        steps_version = getattr(global_task_manager, 'steps_version', 0)
+        window = int(time.time() // self.STATISTICS_ETAG_TTL)
+        return self._task_list_etag(f"stats-{steps_version}-{window}")
+
+    @staticmethod
+    def _not_modified(etag: str) -> Response:
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+
+    @property
+    def script_manager(self):
+        """Shared ScriptManager, created on first use (None when script storage is unavailable)"""
+        if self._script_manager is None and SCRIPT_MANAGER_AVAILABLE:
+            try:
+                self._script_manager = get_script_manager()
+            except Exception as e:
+                if not self._script_manager_warned:
+                    self._script_manager_warned = True
+                    logger.warning(f"⚠️ 脚本管理器初始化失败，脚本接口不可用: {e}")
+        return self._script_manager
+
+    def _config_body(self) -> Tuple[bytes, str]:
+        """Serialized agent_configs and its ETag, computed once per config change"""
+        cached = self._config_cache
+        if cached is None:
+            body = json_response(self.agent_configs).get_data()
+            cached = self._config_cache = (body, hashlib.sha1(body).hexdigest())
+        return cached
+
     def _create_agent_config(self, config: Dict) -> Dict:
         """Create agent configuration from request"""
         # Start with default config
@@ -1354,40 +2045,185 @@ class PhoneAgentWeb:
 
         return agent_config
 
+    @staticmethod
+    def _load_or_create_secret(path: Path) -> bytes:
+        """Read the persisted session key, generating it (mode 0600) on first start"""
+        try:
+            secret = path.read_bytes()
+            if secret:
+                return secret
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ 读取会话密钥文件失败: {e}")
+
+        secret = secrets.token_bytes(32)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secret)
+        except OSError as e:
+            logger.warning(f"⚠️ 无法保存会话密钥，重启后会话将失效: {e}")
+        return secret
+
+    # Uploaded files: let browsers/CDNs cache them for a day
+    STATIC_FILE_MAX_AGE = 86400
+    # Screenshots are write-once (timestamp + random suffix in the name): cache for a year
+    SCREENSHOT_MAX_AGE = 365 * 86400
+
+    # Steps produced within this window are sent to the client as a single step_batch
+    STEP_BATCH_WINDOW = 0.05
+    # ...unless this many pile up first, which sends the batch without waiting out the window
+    STEP_BATCH_MAX = 50
+
+    def _queue_step_update(self, session_id: str, payload: Dict):
+        """Buffer a step_update payload and schedule a batched emit for the session"""
+        with self._pending_steps_lock:
+            pending = self._pending_steps[session_id]
+            pending.append(payload)
+            if len(pending) >= self.STEP_BATCH_MAX:
+                # Full batch: send it now; the session's window timer (if any) stays the only one
+                steps = self._pending_steps.pop(session_id)
+                schedule = False
+            else:
+                steps = None
+                schedule = session_id not in self._step_flush_scheduled
+                if schedule:
+                    self._step_flush_scheduled.add(session_id)
+        if steps:
+            self._emit_steps(session_id, steps)
+        elif schedule:
+            self.socketio.start_background_task(self._flush_step_updates, session_id)
+
+    def _flush_step_updates(self, session_id: str):
+        """Background task: wait for the batch window, then emit what has accumulated"""
+        self.socketio.sleep(self.STEP_BATCH_WINDOW)
+        with self._pending_steps_lock:
+            self._step_flush_scheduled.discard(session_id)
+            steps = self._pending_steps.pop(session_id, None)
+        self._emit_steps(session_id, steps)
+
+    def _emit_pending_steps(self, session_id: str):
+        """Emit all buffered steps for a session now (before a terminal task event)"""
+        with self._pending_steps_lock:
+            steps = self._pending_steps.pop(session_id, None)
+        self._emit_steps(session_id, steps)
+
+    def _emit_steps(self, session_id: str, steps: Optional[List[Dict]]):
+        """Emit steps as one step_batch event (a lone step as step_update)"""
+        # Nobody is watching (tab closed or not yet joined): skip encoding a packet
+        # that would be delivered to no one; the steps remain in the database
+        if not steps or not self._room_has_listeners(session_id):
+            return
+        if len(steps) == 1:
+            # Nothing to coalesce: plain step_update, no batch envelope
+            self.socketio.emit('step_update', steps[0], room=session_id)
+        else:
+            self.socketio.emit('step_batch', {
+                'session_id': session_id,
+                'steps': steps
+            }, room=session_id)
+
+    def _room_has_listeners(self, room: str, namespace: str = '/') -> bool:
+        """Whether any client connected to this server has joined the room"""
+        participants = self.socketio.server.manager.get_participants(namespace, room)
+        try:
+            return next(iter(participants), None) is not None
+        except KeyError:
+            # Older python-socketio managers raise for rooms that were never joined
+            return False
+
+    TASK_REPR_CACHE_MAX = 1024
+    # Bytes of encoded tasks buffered per write when streaming /api/tasks
+    TASK_STREAM_CHUNK = 64 * 1024
+
+    def _task_repr(self, task, detail: bool = False) -> Dict:
+        """Build (or reuse) the API dict for a task.
+
+        Every task mutation bumps last_activity, so the cached dict is reused
+        by repeated polls until the task changes.
+        """
+        key = (detail, task.task_id, task.last_activity, task.status)
+        with self._task_repr_lock:
+            cached = self._task_repr_cache.get(key)
+            if cached is not None:
+                self._task_repr_cache.move_to_end(key)
+                return cached
+
+        if detail:
+            data = {
+                'task_id': task.task_id,
+                'session_id': task.session_id,
+                'user_id': task.user_id,
+                'task_description': task.task_description,
+                'status': task.status,
+                'start_time': task.created_at.isoformat(),  # 映射为前端期望的字段名
+                'end_time': task.end_time.isoformat() if task.end_time else None,
+                'last_activity': task.last_activity.isoformat(),
+                'error_message': task.error_message,
+                'result': task.result,
+                'config': task.config
+            }
+        else:
+            data = {
+                'task_id': task.task_id,
+                'session_id': task.session_id,
+                'user_id': task.user_id,
+                'task_description': task.task_description,
+                'status': task.status,
+                # Raw datetimes: json_bytes writes them as UTC with a 'Z' suffix (映射为前端期望的字段名)
+                'start_time': task.created_at,
+                'end_time': task.end_time,
+                'last_activity': task.last_activity,
+                'error_message': task.error_message,
+                'result': task.result
+            }
+
+        with self._task_repr_lock:
+            self._task_repr_cache[key] = data
+            if len(self._task_repr_cache) > self.TASK_REPR_CACHE_MAX:
+                self._task_repr_cache.popitem(last=False)
+        return data
+
     def _serialize_action(self, action):
         """Serialize action object to JSON-compatible format"""
-        if action is None:
-            return None
-        if isinstance(action, dict):
+        if action is None or isinstance(action, dict):
             return action
-        # Try to convert object to dict
-        try:
-            if hasattr(action, '__dict__'):
-                return action.__dict__
-            else:
-                return str(action)
-        except Exception:
-            return str(action)
+        # Objects expose their fields through __dict__; anything else is sent as text
+        values = getattr(action, '__dict__', None)
+        return values if values is not None else str(action)
+
+    # Attributes copied from action result objects into the serialized dict
+    _RESULT_ATTRS = ('success', 'message', 'error')
+    # Per-type serializer functions, built on first sight of a result class
+    _result_serializers: Dict[type, Callable[[Any], Any]] = {}
+
+    @classmethod
+    def _build_result_serializer(cls, result) -> Callable[[Any], Any]:
+        """Specialize a serializer for the attributes this result's class exposes"""
+        if not (hasattr(result, '__dict__') or hasattr(result, '__slots__')):
+            return str
+        attrs = tuple(name for name in cls._RESULT_ATTRS if hasattr(result, name))
+        if not attrs:
+            return lambda r: {}
+        getter = attrgetter(*attrs)
+        if len(attrs) == 1:
+            name = attrs[0]
+            return lambda r: {name: getter(r)}
+        return lambda r: dict(zip(attrs, getter(r)))
 
     def _serialize_result(self, result):
         """Serialize result object to JSON-compatible format"""
         if result is None:
             return None
-        # Try to convert object to dict
+        result_type = type(result)
+        serializer = self._result_serializers.get(result_type)
+        if serializer is None:
+            serializer = self._result_serializers[result_type] = self._build_result_serializer(result)
         try:
-            if hasattr(result, '__dict__'):
-                # Extract key attributes
-                result_dict = {}
-                if hasattr(result, 'success'):
-                    result_dict['success'] = result.success
-                if hasattr(result, 'message'):
-                    result_dict['message'] = result.message
-                if hasattr(result, 'error'):
-                    result_dict['error'] = result.error
-                return result_dict
-            else:
-                return str(result)
-        except Exception:
+            return serializer(result)
+        except AttributeError:
+            # An instance lacking an attribute its class usually has
             return str(result)
 
     def run(self):
@@ -1396,13 +2232,42 @@ class PhoneAgentWeb:
         print(f"Server: http://{self.host}:{self.port}")
         print(f"Debug mode: {self.debug}")
 
-        self.socketio.run(
-            self.app,
-            host=self.host,
-            port=self.port,
-            debug=self.debug,
-            allow_unsafe_werkzeug=True
-        )
+        try:
+            self.socketio.run(
+                self.app,
+                host=self.host,
+                port=self.port,
+                debug=self.debug,
+                allow_unsafe_werkzeug=True
+            )
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Drop queued tasks, ask running ones to stop and let pending script saves finish"""
+        self.task_executor.shutdown(wait=False, cancel_futures=True)
+        for cancel_event in list(self._cancel_events.values()):
+            cancel_event.set()
+        self.io_executor.shutdown(wait=True)
+
+
+def setup_logging(level: int = logging.INFO) -> QueueListener:
+    """Send log records through a queue; a listener thread does the stream I/O.
+
+    Request handlers and agent threads only enqueue records, so they never
+    contend on the stderr lock.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('[%(levelname)s] %(name)s: %(message)s'))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
 
 
 def main():
@@ -1416,6 +2281,8 @@ def main():
 
     args = parser.parse_args()
 
+    setup_logging(logging.DEBUG if args.debug else logging.INFO)
+
     # Create and run web app
     web_app = PhoneAgentWeb(host=args.host, port=args.port, debug=args.debug)
     web_app.run()
@@ -201,11 +201,15 @@ class ScreenshotManager:
         """Queue a screenshot for async upload"""
         upload_id = str(uuid.uuid4())
 
-        # Create metadata
+        # Create metadata (one stat for existence and size)
+        try:
+            file_size = os.stat(local_path).st_size
+        except OSError:
+            file_size = None
         metadata = ScreenshotMetadata(
             local_path=local_path,
-            file_size=os.path.getsize(local_path) if os.path.exists(local_path) else 0,
-            file_hash=self._calculate_file_hash(local_path) if os.path.exists(local_path) else ""
+            file_size=file_size or 0,
+            file_hash=self._calculate_file_hash(local_path) if file_size is not None else ""
         )
 
         # Add to queue
@@ -258,11 +262,13 @@ class ScreenshotManager:
     def _calculate_file_hash(self, file_path: str) -> str:
         """Calculate SHA256 hash of a file"""
         try:
-            sha256 = hashlib.sha256()
             with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
+                if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                    return hashlib.file_digest(f, 'sha256').hexdigest()
+                sha256 = hashlib.sha256()
+                for chunk in iter(lambda: f.read(1 << 20), b''):
                     sha256.update(chunk)
-            return sha256.hexdigest()
+                return sha256.hexdigest()
         except Exception as e:
             logger.error(f"Error calculating file hash: {e}")
             return ""
@@ -9,10 +9,44 @@ import json
 import hashlib
 import uuid
 import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass, asdict
-from supabase import create_client, Client
+from typing import Dict, List, Optional, Any, Tuple, Iterable, Iterator
+from dataclasses import dataclass, asdict, fields
+from functools import lru_cache, partial
+from supabase import Client
+
+# 与web/app.py相同的导入路径：两种路径会加载两份supabase_manager模块，
+# 各自缓存一个客户端；仅在web目录作为脚本目录直接运行时回退到裸模块名
+try:
+    from web.supabase_manager import get_supabase_client
+except ImportError:
+    from supabase_manager import get_supabase_client
+
+# orjson可选：安装后用于编码导出的脚本JSON
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _dumps_value(value: Any, indent: Optional[int] = None) -> str:
+    """编码单个JSON值（非ASCII字符不转义，无法编码的对象转为str）
+
+    缩进2格时优先用orjson：json.dumps一旦带indent就退回纯Python编码器。
+    """
+    if indent == 2 and ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(
+                value,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+                default=str
+            ).decode('utf-8')
+        except TypeError:
+            # 例如超出64位的整数
+            pass
+    return json.dumps(value, ensure_ascii=False, indent=indent, default=str)
 
 # 从环境变量获取Supabase配置
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -59,6 +93,58 @@ class ScriptRecord:
             data['updated_at'] = data['updated_at'].isoformat()
         return data
 
+    def iter_json(self, chunk_size: int = 65536, indent: Optional[int] = None) -> Iterator[bytes]:
+        """流式编码to_dict()的JSON，按chunk_size分块产出UTF-8字节
+
+        script_data中的steps逐条编码，不像asdict那样深拷贝整份脚本数据。
+        indent与json.dumps的同名参数一致，缩进时输出与json.dumps(indent=...)相同。
+        """
+        return ScriptManager._iter_chunks(self._iter_json_pieces(indent), chunk_size)
+
+    def _iter_json_pieces(self, indent: Optional[int] = None) -> Iterator[str]:
+        dumps = partial(_dumps_value, indent=indent)
+        if indent is None:
+            item_sep = ', '
+
+            def newline(level: int) -> str:
+                return ''
+
+            def nested(value, level: int) -> str:
+                return dumps(value)
+        else:
+            item_sep = ','
+
+            def newline(level: int) -> str:
+                return '\n' + ' ' * (indent * level)
+
+            def nested(value, level: int) -> str:
+                # JSON字符串中的换行已转义，按行首补齐所在层级的缩进即可
+                return dumps(value).replace('\n', newline(level))
+
+        yield '{'
+        for i, f in enumerate(fields(self)):
+            value = getattr(self, f.name)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            yield (item_sep if i else '') + newline(1) + dumps(f.name) + ': '
+            steps = value.get('steps') if f.name == 'script_data' and isinstance(value, dict) else None
+            if not isinstance(steps, list):
+                yield nested(value, 1)
+                continue
+            # script_data按键输出，steps逐条编码
+            yield '{'
+            for j, (key, item) in enumerate(value.items()):
+                yield (item_sep if j else '') + newline(2) + dumps(key) + ': '
+                if key != 'steps' or not steps:
+                    yield nested(item, 2)
+                    continue
+                yield '['
+                for k, step in enumerate(steps):
+                    yield (item_sep if k else '') + newline(3) + nested(step, 3)
+                yield newline(2) + ']'
+            yield newline(1) + '}'
+        yield newline(0) + '}'
+
     @classmethod
     def from_dict(cls, data: Dict) -> 'ScriptRecord':
         """从字典创建对象，处理datetime反序列化"""
@@ -111,12 +197,27 @@ class ScriptRecord:
 class ScriptManager:
     """脚本持久化管理器"""
 
+    # 脚本摘要缓存的有效期（秒）：本进程内的写入会立即失效缓存，TTL只兜底其他进程的写入
+    SUMMARY_CACHE_TTL = 15.0
+
     def __init__(self):
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("Supabase配置未找到，请检查环境变量SUPABASE_URL和SUPABASE_SECRET_KEY")
 
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        self.supabase: Client = get_supabase_client()
+        self.writer: Client = get_supabase_client('write')
         self.lock = threading.Lock()
+        # limit -> (缓存时间, 摘要列表)
+        self._summary_cache: Dict[int, Tuple[float, List[Dict]]] = {}
+        # 每次失效递增：查询期间发生写入时，不把旧结果放回缓存
+        self._summary_generation = 0
+        self._summary_lock = threading.Lock()
+
+    def _invalidate_summary(self):
+        """脚本被创建/更新/删除后清空摘要缓存"""
+        with self._summary_lock:
+            self._summary_cache.clear()
+            self._summary_generation += 1
 
     def save_script(self, script_record: ScriptRecord) -> Optional[str]:
         """保存脚本到数据库"""
@@ -137,17 +238,19 @@ class ScriptManager:
                 # 如果有ID，更新；否则创建
                 if script_record.id:
                     # 更新现有记录
-                    result = self.supabase.table('scripts').update(script_dict).eq('id', script_record.id).execute()
+                    result = self.writer.table('scripts').update(script_dict).eq('id', script_record.id).execute()
                     if result.data:
+                        self._invalidate_summary()
                         print(f"脚本已更新: {script_record.id}")
                         return script_record.id
                 else:
                     # 创建新记录
                     script_dict['id'] = str(uuid.uuid4())
-                    result = self.supabase.table('scripts').insert(script_dict).execute()
+                    result = self.writer.table('scripts').insert(script_dict).execute()
                     if result.data:
                         script_id = result.data[0]['id']
                         script_record.id = script_id
+                        self._invalidate_summary()
                         print(f"脚本已创建: {script_id}")
                         return script_id
 
@@ -205,12 +308,22 @@ class ScriptManager:
             return []
 
     def get_script_summary(self, limit: int = 100) -> List[Dict]:
-        """获取脚本摘要信息"""
+        """获取脚本摘要信息（按limit缓存，返回的列表为共享对象，调用方不应修改）"""
+        with self._summary_lock:
+            cached = self._summary_cache.get(limit)
+            if cached is not None and time.monotonic() - cached[0] < self.SUMMARY_CACHE_TTL:
+                return cached[1]
+            generation = self._summary_generation
         try:
             result = self.supabase.table('script_summary').select('*').order('created_at', desc=True).limit(limit).execute()
-            if result.data:
-                return result.data
-            return []
+            summary = result.data or []
+            with self._summary_lock:
+                if generation == self._summary_generation:
+                    if len(self._summary_cache) >= 32:
+                        # limit来自请求参数：不让任意取值把缓存撑大
+                        self._summary_cache.clear()
+                    self._summary_cache[limit] = (time.monotonic(), summary)
+            return summary
         except Exception as e:
             print(f"获取脚本摘要时出错: {e}")
             return []
@@ -221,12 +334,13 @@ class ScriptManager:
             with self.lock:
                 if soft_delete:
                     # 软删除：标记为非活跃状态
-                    result = self.supabase.table('scripts').update({'is_active': False}).eq('id', script_id).execute()
+                    result = self.writer.table('scripts').update({'is_active': False}).eq('id', script_id).execute()
                 else:
                     # 硬删除
-                    result = self.supabase.table('scripts').delete().eq('id', script_id).execute()
+                    result = self.writer.table('scripts').delete().eq('id', script_id).execute()
 
                 if result.data:
+                    self._invalidate_summary()
                     print(f"脚本已删除: {script_id}")
                     return True
                 else:
@@ -244,7 +358,7 @@ class ScriptManager:
                 return None
 
             if format.lower() == "json":
-                return json.dumps(script.to_dict(), ensure_ascii=False, indent=2)
+                return _dumps_value(script.to_dict(), indent=2)
             elif format.lower() == "python":
                 # 生成Python重放脚本
                 return self._generate_python_replay_script(script)
@@ -255,6 +369,44 @@ class ScriptManager:
             print(f"导出脚本时出错: {e}")
             return None
 
+    def export_script_iter(self, script_id: str, format: str = "json",
+                           chunk_size: int = 65536) -> Optional[Iterator[bytes]]:
+        """流式导出脚本，按chunk_size分块产出UTF-8字节；脚本不存在或格式不支持时返回None
+
+        JSON逐步骤编码（与export_script的缩进格式相同）；Python重放脚本是固定模板，
+        大小与步骤数无关，整体生成后作为单个块返回。
+        """
+        try:
+            script = self.get_script(script_id)
+            if not script:
+                return None
+
+            if format.lower() == "json":
+                return script.iter_json(chunk_size, indent=2)
+            elif format.lower() == "python":
+                return iter([self._generate_python_replay_script(script).encode('utf-8')])
+            else:
+                print(f"不支持的导出格式: {format}")
+                return None
+        except Exception as e:
+            print(f"导出脚本时出错: {e}")
+            return None
+
+    @staticmethod
+    def _iter_chunks(pieces: Iterable[str], chunk_size: int) -> Iterator[bytes]:
+        """将零散的字符串片段合并为约chunk_size大小的字节块"""
+        buffer: List[str] = []
+        size = 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+
     def _generate_python_replay_script(self, script: ScriptRecord) -> str:
         """生成Python重放脚本"""
         script_data = script.script_data
@@ -468,10 +620,11 @@ if __name__ == "__main__":
         try:
             cutoff_date = datetime.now().replace(tzinfo=None) - timedelta(days=days)
 
-            result = self.supabase.table('scripts').update({'is_active': False}).lt('created_at', cutoff_date.isoformat()).execute()
+            result = self.writer.table('scripts').update({'is_active': False}).lt('created_at', cutoff_date.isoformat()).execute()
 
             if result.data:
                 cleaned_count = len(result.data)
+                self._invalidate_summary()
                 print(f"清理了 {cleaned_count} 个旧脚本")
                 return cleaned_count
             else:
@@ -482,5 +635,15 @@ if __name__ == "__main__":
             return 0
 
 
+@lru_cache(maxsize=None)
+def get_script_manager() -> ScriptManager:
+    """进程内共享的脚本管理器
+
+    Web接口和每个任务的ScriptRecorder复用同一个实例，而不是各自构造；
+    构造失败时不会被缓存，下次调用会重试。
+    """
+    return ScriptManager()
+
+
 # 导出主要类
-__all__ = ['ScriptManager', 'ScriptRecord']
\ No newline at end of file
+__all__ = ['ScriptManager', 'ScriptRecord', 'get_script_manager']
\ No newline at end of file
@@ -22,8 +22,10 @@ class PhoneAgentWeb {
 
     init() {
         // Initialize Socket.IO connection with robust configuration
+        // Transports come from the server config (websocket-only by default)
+        this.socketTransports = window.SOCKETIO_TRANSPORTS || ['websocket'];
         this.socket = io({
-            transports: ['polling', 'websocket'],
+            transports: this.socketTransports,
             upgrade: true,
             rememberUpgrade: true,
             timeout: 20000,
@@ -84,7 +86,8 @@ class PhoneAgentWeb {
             this.updateConnectionStatus(false);
 
             // 根据错误类型提供用户提示
-            if (error.message && error.message.includes('Invalid frame header')) {
+            if (error.message && error.message.includes('Invalid frame header')
+                && this.socketTransports.includes('polling')) {
                 console.warn('WebSocket frame error, falling back to polling');
                 // 强制使用长轮询
                 this.socket.io.opts.transports = ['polling'];
@@ -121,6 +124,11 @@ class PhoneAgentWeb {
             this.onStepUpdate(data);
         });
 
+        // Steps emitted close together arrive batched; each entry has the step_update shape
+        this.socket.on('step_batch', (data) => {
+            (data.steps || []).forEach(step => this.onStepUpdate(step));
+        });
+
         this.socket.on('task_completed', (data) => {
             this.onTaskCompleted(data);
         });
@@ -132,6 +140,13 @@ class PhoneAgentWeb {
         this.socket.on('task_stopped', (data) => {
             this.onTaskStopped(data);
         });
+
+        // Recorded scripts are saved after the task ends; refresh history to show the script link
+        this.socket.on('script_ready', (data) => {
+            if (data.script_id) {
+                this.loadTaskHistory();
+            }
+        });
     }
 
     setupUIListeners() {
@@ -6,19 +6,41 @@ Supabase 任务管理器
 
 import os
 import json
+import hashlib
+import mmap
+import queue
+import atexit
 import threading
 import uuid
+import weakref
 import logging
 import dataclasses
 import re
 import time
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass, asdict
 from functools import lru_cache
+from collections import Counter, defaultdict
 from supabase import create_client, Client
 
+# 较新的supabase-py（ClientOptions带httpx_client字段）允许注入自定义HTTP客户端，
+# 从而设置连接池大小；旧版本使用库内默认的连接池
+try:
+    import httpx
+    from supabase import ClientOptions
+    HTTPX_CLIENT_INJECTION = 'httpx_client' in getattr(ClientOptions, '__dataclass_fields__', {})
+except ImportError:
+    HTTPX_CLIENT_INJECTION = False
+
+# httpx需要安装h2才能使用HTTP/2（同一连接上多路复用请求）
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # 配置日志
 logger = logging.getLogger(__name__)
 if not logger.handlers:
@@ -27,6 +49,8 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
+    # 已有独立输出，不再传递给根日志器（避免配置根日志后重复输出）
+    logger.propagate = False
 
 # 加载环境变量
 try:
@@ -39,6 +63,35 @@ except ImportError:
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SECRET_KEY', os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
 
+# 每个共享客户端的HTTP连接池上限（仅在可注入httpx客户端时生效）
+SUPABASE_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', 64))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv('SUPABASE_MAX_KEEPALIVE', 16))
+SUPABASE_HTTP_TIMEOUT = float(os.getenv('SUPABASE_HTTP_TIMEOUT', 60))
+
+
+@lru_cache(maxsize=None)
+def get_supabase_client(purpose: str = 'read') -> Client:
+    """进程内共享的Supabase客户端
+
+    各管理器复用同一个客户端及其底层HTTP连接池（keep-alive），
+    避免每个管理器各自建立连接和TLS握手。
+    purpose='write' 返回独立的写入客户端：智能体的步骤/任务写入使用单独的连接池，
+    不会被Web界面的大量查询占满连接而阻塞。
+    """
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("Supabase配置未找到，请检查环境变量SUPABASE_URL和SUPABASE_SECRET_KEY")
+    if not HTTPX_CLIENT_INJECTION:
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+        ),
+        http2=HTTP2_AVAILABLE,
+        timeout=SUPABASE_HTTP_TIMEOUT,
+    )
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=http_client))
+
 # 时区安全处理函数
 def normalize_datetime(dt: datetime) -> datetime:
     """
@@ -80,6 +133,37 @@ def safe_datetime_sort_key(task) -> datetime:
         # 降级处理：返回最小可能时间
         return datetime.min
 
+
+class UUIDPool:
+    """UUID4生成器：按4KB批量读取os.urandom，而不是每个ID一次系统调用
+
+    生成的仍是标准带连字符的UUID4字符串，可直接写入UUID类型的列。
+    """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buf = b''
+        self._off = 0
+
+    def next(self) -> str:
+        with self._lock:
+            if self._off + 16 > len(self._buf):
+                self._buf = os.urandom(self.CHUNK_SIZE)
+                self._off = 0
+            raw = self._buf[self._off:self._off + 16]
+            self._off += 16
+        return str(uuid.UUID(bytes=raw, version=4))
+
+
+# 步骤/截图记录ID的共享生成器
+uuid_pool = UUIDPool()
+if hasattr(os, 'register_at_fork'):
+    # 子进程不能复用父进程缓冲区中剩余的随机字节，否则会生成重复ID
+    os.register_at_fork(after_in_child=lambda: setattr(uuid_pool, '_off', len(uuid_pool._buf)))
+
+
 @dataclass
 class GlobalTask:
     """Global task information that persists across page refreshes"""
@@ -190,12 +274,21 @@ class FileInfo:
 class LocalFileScanner:
     """本地文件扫描器 - 支持LRU缓存和性能优化"""
 
+    # _load_config返回的全部配置项，配置更新接口据此校验请求中的键
+    CONFIG_KEYS = frozenset({
+        'enabled', 'screenshots_dir', 'cache_timeout',
+        'max_files', 'time_window_minutes', 'scan_batch_size',
+        'enable_lru_cache', 'enable_performance_monitoring', 'enable_async_scan',
+        'debug_mode', 'log_level',
+    })
+
     def __init__(self, screenshots_dir: str = "static/screenshots", cache_timeout: int = 300):
         self.screenshots_dir = screenshots_dir
         self.cache_timeout = cache_timeout
         self._cache = {}
         self._cache_timestamp = 0
-        self._scan_lock = threading.Lock()
+        # 可重入：进程内共享同一个扫描器，扫描、清缓存和配置更新都在此锁下进行
+        self._scan_lock = threading.RLock()
         self._performance_stats = {
             'scans_count': 0,
             'cache_hits': 0,
@@ -235,7 +328,13 @@ class LocalFileScanner:
 
     def update_config(self, new_config: Dict[str, Any]) -> None:
         """更新配置"""
-        self.config.update(new_config)
+        with self._scan_lock:
+            self.config.update(new_config)
+            self.cache_timeout = self.config['cache_timeout']
+            if self.config['screenshots_dir'] != self.screenshots_dir:
+                # 目录变化后旧的扫描结果失效
+                self.screenshots_dir = self.config['screenshots_dir']
+                self.clear_cache()
         logger.info(f"[LocalFileScanner] 配置已更新: {new_config}")
 
     def scan_screenshots(self) -> List[FileInfo]:
@@ -280,7 +379,7 @@ class LocalFileScanner:
             try:
                 # 使用os.scandir提高性能
                 scan_start = time.time()
-                with os.scandir(screenshots_dir) as entries:
+                with os.scandir(screenshots_path) as entries:
                     for entry in entries:
                         if (entry.is_file() and
                             entry.name.startswith('screenshot_') and
@@ -383,6 +482,15 @@ class LocalFileScanner:
         return None
 
 
+@lru_cache(maxsize=None)
+def get_local_file_scanner() -> LocalFileScanner:
+    """进程内共享的本地截图扫描器
+
+    扫描结果缓存和配置只有在同一个实例上才有意义，因此各调用方都通过这里获取。
+    """
+    return LocalFileScanner()
+
+
 class ScreenshotMatcher:
     """截图匹配算法"""
 
@@ -488,6 +596,180 @@ class PathConverter:
         return Path(local_path).exists() and Path(local_path).is_file()
 
 
+class StepWriter:
+    """步骤/截图后台批量写入器
+
+    进程内共享一个实例（见get_step_writer）：写入线程在第一次入队时才启动，
+    创建多少个SupabaseTaskManager都只有这一个线程。
+    """
+
+    # 单次批量插入的最大行数
+    BATCH_MAX = 256
+    # 收到第一条记录后等待的秒数，让同一时间段内的记录合并为一次插入
+    FLUSH_INTERVAL = 0.5
+    # PostgREST在schema缓存中找不到被调用函数时返回的错误码
+    RPC_NOT_FOUND = 'PGRST202'
+
+    def __init__(self, client: Client):
+        self.client = client
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 数据库中是否有insert_step_batch函数（迁移005）；调用失败提示函数不存在时置为False
+        self.rpc_available = True
+        # 已写入的批次数：只由后台线程递增，供/api/statistics生成ETag
+        self.version = 0
+
+    def put(self, table: str, row: Dict):
+        """将一行记录加入写入队列（table为task_steps或step_screenshots）"""
+        self._ensure_started()
+        self._queue.put((table, row))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="supabase-step-flusher", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待此前入队的记录全部写入数据库"""
+        thread = self._thread
+        if thread is None:
+            # 从未入队：没有需要等待的记录
+            return True
+        if not thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """写入队列中剩余的数据并停止后台线程（之后再入队会重新启动线程）"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=10)
+
+    def _run(self):
+        """后台线程：取出队列中的记录并按表批量插入"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if not isinstance(item, threading.Event):
+                time.sleep(self.FLUSH_INTERVAL)
+            batch = [item]
+            stop = False
+            while len(batch) < self.BATCH_MAX:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            # 先插入步骤再插入截图，保证step_screenshots.step_id外键已存在
+            steps = []
+            screenshots = []
+            waiters = []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item[0] == 'task_steps':
+                    steps.append(item[1])
+                else:
+                    screenshots.append(item[1])
+            screenshots = [row for row in screenshots if self._fill_screenshot_metadata(row)]
+            if not (steps and screenshots and self._insert_step_batch(steps, screenshots)):
+                if steps:
+                    self._insert_rows('task_steps', steps)
+                if screenshots:
+                    self._insert_rows('step_screenshots', screenshots)
+            if steps or screenshots:
+                # 先于flush的等待者递增：flush返回后统计的ETag已经变化
+                self.version += 1
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    @staticmethod
+    def _fill_screenshot_metadata(row: Dict) -> bool:
+        """补全截图记录的文件大小和SHA256（在后台线程执行），文件不存在时返回False"""
+        if row.get('file_size') is not None and row.get('file_hash'):
+            return True
+        path = row.get('screenshot_path')
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    # 直接对映射的页做哈希：不复制到Python bytes，哈希期间释放GIL
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        digest = hashlib.sha256(mapped, usedforsecurity=False)
+                else:
+                    digest = hashlib.sha256(usedforsecurity=False)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Screenshot file not found, skipping record: {path} ({e})")
+            return False
+        row['file_size'] = size
+        row['file_hash'] = digest.hexdigest()
+        return True
+
+    def _insert_step_batch(self, steps: List[Dict], screenshots: List[Dict]) -> bool:
+        """通过insert_step_batch函数在一次往返、一个事务内写入步骤和截图
+
+        函数不存在或调用失败时返回False，由调用方回退为按表分别插入。
+        """
+        if not self.rpc_available:
+            return False
+        try:
+            params = json.loads(json.dumps(
+                {'steps': steps, 'screenshots': screenshots}, default=str
+            ))
+            self.client.rpc('insert_step_batch', params).execute()
+            logger.debug(f"Batch inserted {len(steps)} steps and {len(screenshots)} screenshots via RPC")
+            return True
+        except Exception as e:
+            if getattr(e, 'code', None) == self.RPC_NOT_FOUND:
+                # PostgREST找不到函数（未执行迁移005）：之后不再尝试；
+                # 函数内部的约束冲突、超时等错误只让本批回退
+                self.rpc_available = False
+                logger.warning(f"insert_step_batch函数不可用，改为按表分别插入: {e}")
+            else:
+                logger.error(f"Error inserting step batch via RPC: {e}")
+            return False
+
+    def _insert_rows(self, table: str, rows: List[Dict]):
+        """批量插入，失败时逐行重试以免整批丢失"""
+        try:
+            rows = json.loads(json.dumps(rows, default=str))
+            # return=minimal: the rows are not needed back, skip echoing them in the response
+            self.client.table(table).insert(rows, returning='minimal').execute()
+            logger.debug(f"Batch inserted {len(rows)} rows into {table}")
+        except Exception as e:
+            logger.error(f"Error batch inserting into {table}: {e}")
+            if len(rows) > 1:
+                for row in rows:
+                    try:
+                        self.client.table(table).insert(row, returning='minimal').execute()
+                    except Exception as row_error:
+                        logger.error(f"Error inserting row {row.get('id')} into {table}: {row_error}")
+
+
+@lru_cache(maxsize=None)
+def get_step_writer() -> StepWriter:
+    """进程内共享的步骤写入器，使用写入客户端；退出时写完队列中剩余的记录"""
+    writer = StepWriter(get_supabase_client('write'))
+    atexit.register(writer.close)
+    return writer
+
+
 class SupabaseTaskManager:
     """基于Supabase的全局任务管理器"""
 
@@ -504,11 +786,24 @@ class SupabaseTaskManager:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("Supabase配置未找到，请检查环境变量SUPABASE_URL和SUPABASE_SECRET_KEY")
 
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # 查询使用共享的读取客户端，插入/更新/删除走独立的写入连接池
+        self.supabase: Client = get_supabase_client()
+        self.writer: Client = get_supabase_client('write')
         self.tasks: Dict[str, GlobalTask] = {}
-        self.active_threads: Dict[str, threading.Thread] = {}
+        # session_id -> task_id 索引：按会话查询时无需扫描全部任务
+        self._by_session: Dict[str, Set[str]] = defaultdict(set)
+        # 任务集合的版本号：每次增删改（持有self.lock时）递增，供/api/tasks生成ETag
+        self.version = 0
+        # count_tasks的(时间戳, 数量)缓存：负载均衡器的连续健康检查合并为一次计数查询
+        self._count_cache: Tuple[float, Optional[int]] = (0.0, None)
+        self._count_lock = threading.Lock()
+        # 弱引用：任务线程/Future结束后自动移除，不会随任务总数增长
+        self.active_threads: 'weakref.WeakValueDictionary[str, Any]' = weakref.WeakValueDictionary()
         self.lock = threading.Lock()
 
+        # 步骤/截图由进程内共享的后台写入器批量插入，避免每个步骤一次HTTP往返
+        self._step_writer = get_step_writer()
+
         # 尝试创建tasks表（如果不存在）
         self._create_table_if_not_exists()
 
@@ -634,10 +929,12 @@ class SupabaseTaskManager:
 
                 # 使用task_id作为内存存储的主键
                 self.tasks[task.task_id] = task
+                self._by_session[task.session_id].add(task.task_id)
+                self.version += 1
 
                 # 添加到数据库
                 task_dict = task.to_dict()
-                result = self.supabase.table('tasks').insert(task_dict).execute()
+                result = self.writer.table('tasks').insert(task_dict).execute()
 
                 if result.data:
                     print(f"任务已添加到数据库: {task.task_id}")
@@ -672,6 +969,7 @@ class SupabaseTaskManager:
                 for key, value in kwargs.items():
                     if hasattr(task, key):
                         setattr(task, key, value)
+                self.version += 1
 
                 # 更新数据库中的任务
                 update_data = {k: v for k, v in kwargs.items() if k != 'global_task_id'}
@@ -684,7 +982,7 @@ class SupabaseTaskManager:
                 if 'last_activity' in update_data and isinstance(update_data['last_activity'], datetime):
                     update_data['last_activity'] = update_data['last_activity'].isoformat()
 
-                result = self.supabase.table('tasks').update(update_data).eq('task_id', task.task_id).execute()
+                result = self.writer.table('tasks').update(update_data).eq('task_id', task.task_id).execute()
 
                 if result.data:
                     logger.debug(f"Task updated successfully: {task.task_id}, affected rows: {len(result.data)}")
@@ -722,6 +1020,23 @@ class SupabaseTaskManager:
         with self.lock:
             return [task for task in self.tasks.values() if task.status == 'running']
 
+    COUNT_CACHE_TTL = 1.0
+
+    def count_tasks(self) -> int:
+        """数据库中的任务总数（只取count，不传输行数据；结果缓存COUNT_CACHE_TTL秒）"""
+        cached_at, count = self._count_cache
+        if count is not None and time.monotonic() - cached_at < self.COUNT_CACHE_TTL:
+            return count
+        with self._count_lock:
+            # 双重检查：等锁期间其他线程可能已刷新
+            cached_at, count = self._count_cache
+            if count is not None and time.monotonic() - cached_at < self.COUNT_CACHE_TTL:
+                return count
+            result = self.supabase.table('tasks').select('task_id', count='exact', head=True).execute()
+            count = result.count or 0
+            self._count_cache = (time.monotonic(), count)
+            return count
+
     def create_task(self, task_id: str, session_id: str, user_id: str,
                    task_description: str, config: Dict) -> GlobalTask:
         """Create a new global task"""
@@ -757,9 +1072,9 @@ class SupabaseTaskManager:
     def get_tasks_by_session(self, session_id: str) -> List[GlobalTask]:
         """Get tasks by session ID（按创建时间降序）"""
         with self.lock:
-            # 过滤并按创建时间降序排列 - 使用时区安全的排序
+            # 通过会话索引取任务并按创建时间降序排列 - 使用时区安全的排序
             return sorted(
-                [task for task in self.tasks.values() if task.session_id == session_id],
+                [self.tasks[tid] for tid in self._by_session.get(session_id, ()) if tid in self.tasks],
                 key=safe_datetime_sort_key,
                 reverse=True
             )
@@ -767,28 +1082,23 @@ class SupabaseTaskManager:
     def stop_task(self, task_id: str) -> bool:
         """Stop a task, supports task_id or global_task_id"""
         try:
-            with self.lock:
-                # 查找任务
-                task = self.get_task(task_id)
-                if not task:
-                    return False
+            # get_task/update_task_status take self.lock themselves, so it must not be held here
+            task = self.get_task(task_id)
+            if not task:
+                return False
 
-                # Update task status
-                self.update_task_status(task.task_id, "stopped")
+            # Update task status
+            self.update_task_status(task.task_id, "stopped")
 
-                # Stop thread if exists
-                if task.task_id in self.active_threads:
-                    try:
-                        thread = self.active_threads[task.task_id]
-                        # 由于Python线程不能直接强制停止，我们只能标记状态
-                        # 在实际的任务执行中需要检查停止标志
-                        print(f"标记任务停止: {task.task_id}")
-                    except Exception as thread_error:
-                        print(f"停止线程时出错: {thread_error}")
-                    finally:
-                        del self.active_threads[task.task_id]
+            # Stop thread if exists
+            with self.lock:
+                worker = self.active_threads.pop(task.task_id, None)
+            if worker is not None:
+                # 由于Python线程不能直接强制停止，我们只能标记状态
+                # 在实际的任务执行中需要检查停止标志
+                print(f"标记任务停止: {task.task_id}")
 
-                return True
+            return True
 
         except Exception as e:
             print(f"停止任务时出错: {e}")
@@ -805,9 +1115,11 @@ class SupabaseTaskManager:
 
                 # 从内存中删除
                 del self.tasks[task.task_id]
+                self._discard_session_index(task)
+                self.version += 1
 
                 # 从数据库中删除
-                result = self.supabase.table('tasks').delete().eq('task_id', task.task_id).execute()
+                result = self.writer.table('tasks').delete().eq('task_id', task.task_id).execute()
 
                 if result.data:
                     print(f"任务已删除: {task.task_id}")
@@ -843,6 +1155,8 @@ class SupabaseTaskManager:
 
             with self.lock:
                 self.tasks.clear()
+                self._by_session.clear()
+                self.version += 1
 
                 for task_data in result.data:
                     task_id = task_data.get('task_id', 'unknown')
@@ -859,6 +1173,7 @@ class SupabaseTaskManager:
                         # 2. 尝试加载单个任务
                         task = GlobalTask.from_dict(task_data)
                         self.tasks[task.task_id] = task
+                        self._by_session[task.session_id].add(task.task_id)
                         success_count += 1
 
                     except Exception as e:
@@ -902,8 +1217,18 @@ class SupabaseTaskManager:
             # 如果数据库连接失败，使用空的任务列表
             with self.lock:
                 self.tasks.clear()
+                self._by_session.clear()
+                self.version += 1
             return False
 
+    def _discard_session_index(self, task: GlobalTask):
+        """从会话索引中移除任务（调用方需持有self.lock）"""
+        session_tasks = self._by_session.get(task.session_id)
+        if session_tasks is not None:
+            session_tasks.discard(task.task_id)
+            if not session_tasks:
+                del self._by_session[task.session_id]
+
     def save_tasks(self) -> bool:
         """保存所有任务到数据库（实际上任务是实时保存的，这里是为了兼容性）"""
         # 由于Supabase是实时保存的，这个方法主要是为了兼容性
@@ -917,8 +1242,7 @@ class SupabaseTaskManager:
     def unregister_thread(self, task_id: str):
         """取消注册任务线程，支持task_id或global_task_id"""
         with self.lock:
-            if task_id in self.active_threads:
-                del self.active_threads[task_id]
+            self.active_threads.pop(task_id, None)
 
     def cleanup_old_tasks(self, days: int = 30) -> int:
         """清理旧任务，返回删除的任务数量"""
@@ -926,14 +1250,22 @@ class SupabaseTaskManager:
             cutoff_date = datetime.now().replace(tzinfo=None) - timedelta(days=days)
 
             # 从数据库删除旧任务
-            result = self.supabase.table('tasks').delete().lt('created_at', cutoff_date.isoformat()).execute()
+            result = self.writer.table('tasks').delete().lt('created_at', cutoff_date.isoformat()).execute()
 
             if result.data:
                 deleted_count = len(result.data)
                 print(f"清理了 {deleted_count} 个旧任务")
 
-                # 重新加载任务
-                self.load_tasks()
+                # 按删除结果一次性剔除内存中的任务并重建会话索引，而不是重新加载全部任务
+                deleted_ids = frozenset(row.get('task_id') for row in result.data)
+                with self.lock:
+                    self.tasks = {
+                        tid: task for tid, task in self.tasks.items() if tid not in deleted_ids
+                    }
+                    self._by_session.clear()
+                    for tid, task in self.tasks.items():
+                        self._by_session[task.session_id].add(tid)
+                    self.version += 1
                 return deleted_count
             else:
                 print("没有需要清理的旧任务")
@@ -957,7 +1289,7 @@ class SupabaseTaskManager:
                 # 使用 default=str 强制转换
                 step_data = json.loads(json.dumps(step_data, default=str))
 
-            result = self.supabase.table('task_steps').insert(step_data).execute()
+            result = self.writer.table('task_steps').insert(step_data).execute()
 
             if result.data:
                 step_id = result.data[0].get('id')
@@ -974,10 +1306,40 @@ class SupabaseTaskManager:
                 logger.error(f"Step data keys: {list(step_data.keys())}")
             return None
 
+    def enqueue_step(self, step_data: Dict) -> str:
+        """将步骤加入后台批量写入队列，返回客户端生成的步骤ID"""
+        step_data = dict(step_data)
+        step_data.setdefault('id', uuid_pool.next())
+        self._step_writer.put('task_steps', step_data)
+        return step_data['id']
+
+    def enqueue_step_screenshot(self, screenshot_data: Dict) -> str:
+        """将截图记录加入后台批量写入队列，返回截图ID
+
+        未提供file_size/file_hash时由后台线程读取文件补全，调用方无需访问磁盘。
+        """
+        screenshot_data = dict(screenshot_data)
+        screenshot_data.setdefault('id', uuid_pool.next())
+        self._step_writer.put('step_screenshots', screenshot_data)
+        return screenshot_data['id']
+
+    @property
+    def steps_version(self) -> int:
+        """本进程写入步骤/截图的批次数，步骤统计随之变化"""
+        return self._step_writer.version
+
+    def flush_steps(self, timeout: float = 10.0) -> bool:
+        """等待此前入队的步骤/截图全部写入数据库"""
+        return self._step_writer.flush(timeout)
+
+    def close_step_writer(self):
+        """写入队列中剩余的数据并停止后台线程"""
+        self._step_writer.close()
+
     def save_steps_batch(self, steps_data: List[Dict]) -> bool:
         """批量保存步骤数据"""
         try:
-            result = self.supabase.table('task_steps').insert(steps_data).execute()
+            result = self.writer.table('task_steps').insert(steps_data).execute()
 
             if result.data:
                 logger.info(f"Batch saved {len(steps_data)} steps")
@@ -1012,10 +1374,91 @@ class SupabaseTaskManager:
             logger.error(f"Error getting task steps: {e}")
             return []
 
+    def get_task_steps_page(self, task_id: str, offset: int, limit: int) -> Tuple[List[Dict], int]:
+        """分页获取任务步骤（在数据库中分页），返回(当前页步骤, 步骤总数)"""
+        try:
+            result = self.supabase.table('task_steps')\
+                .select('*', count='exact')\
+                .eq('task_id', task_id)\
+                .order('step_number', desc=False)\
+                .range(offset, offset + max(limit, 1) - 1)\
+                .execute()
+
+            return (result.data or [])[:max(limit, 0)], result.count or 0
+
+        except Exception as e:
+            # PostgREST 对超出末尾的范围返回错误，此时返回空页和真实总数
+            if offset > 0:
+                total = self.count_task_steps(task_id)
+                if offset >= total:
+                    return [], total
+            logger.error(f"Error getting task steps page: {e}")
+            return [], 0
+
+    def count_task_steps(self, task_id: str) -> int:
+        """统计任务的步骤数量"""
+        try:
+            result = self.supabase.table('task_steps')\
+                .select('id', count='exact')\
+                .eq('task_id', task_id)\
+                .limit(1)\
+                .execute()
+            return result.count or 0
+        except Exception as e:
+            logger.error(f"Error counting task steps: {e}")
+            return 0
+
+    def get_task_statistics(self, task_id: str) -> Dict:
+        """获取任务步骤统计，只查询统计所需的列而不是完整步骤"""
+        rows = []
+        try:
+            result = self.supabase.table('task_steps')\
+                .select('success,duration_ms')\
+                .eq('task_id', task_id)\
+                .execute()
+            rows = result.data or []
+        except Exception as e:
+            logger.error(f"Error getting task statistics: {e}")
+
+        return self.summarize_steps(rows)
+
+    @staticmethod
+    def summarize_steps(steps: List[Dict]) -> Dict:
+        """单次遍历步骤行，累计成功数与总耗时"""
+        successful_steps = 0
+        total_duration = 0
+        for step in steps:
+            if step.get('success') is True:
+                successful_steps += 1
+            total_duration += step.get('duration_ms') or 0
+        total_steps = len(steps)
+
+        return {
+            'total_steps': total_steps,
+            'successful_steps': successful_steps,
+            'failed_steps': total_steps - successful_steps,
+            'success_rate': successful_steps / max(total_steps, 1),
+            'total_duration_ms': total_duration,
+            'average_step_duration_ms': total_duration / max(total_steps, 1)
+        }
+
+    def count_step_screenshots(self, task_id: str) -> int:
+        """统计任务的截图数量"""
+        try:
+            result = self.supabase.table('step_screenshots')\
+                .select('id', count='exact')\
+                .eq('task_id', task_id)\
+                .limit(1)\
+                .execute()
+            return result.count or 0
+        except Exception as e:
+            logger.error(f"Error counting step screenshots: {e}")
+            return 0
+
     def save_step_screenshot(self, screenshot_data: Dict) -> bool:
         """保存步骤截图信息"""
         try:
-            result = self.supabase.table('step_screenshots').insert(screenshot_data).execute()
+            result = self.writer.table('step_screenshots').insert(screenshot_data).execute()
 
             if result.data:
                 logger.debug(f"Screenshot saved: {screenshot_data.get('id')}")
@@ -1028,14 +1471,15 @@ class SupabaseTaskManager:
             logger.error(f"Error saving screenshot: {e}")
             return False
 
-    def get_step_screenshots(self, task_id: str) -> List[Dict]:
-        """获取任务的所有截图"""
+    def get_step_screenshots(self, task_id: str, order_by_step: bool = False) -> List[Dict]:
+        """获取任务的所有截图；order_by_step=True时按step_id排序，便于按步骤顺序分组"""
         try:
-            result = self.supabase.table('step_screenshots')\
+            query = self.supabase.table('step_screenshots')\
                 .select('*')\
-                .eq('task_id', task_id)\
-                .order('created_at', desc=False)\
-                .execute()
+                .eq('task_id', task_id)
+            if order_by_step:
+                query = query.order('step_id', desc=False)
+            result = query.order('created_at', desc=False).execute()
 
             if result.data:
                 return result.data
@@ -1046,6 +1490,18 @@ class SupabaseTaskManager:
             logger.error(f"Error getting step screenshots: {e}")
             return []
 
+    def count_screenshots_by_step(self, task_id: str) -> Dict[str, int]:
+        """统计每个步骤的截图数量，只查询step_id列"""
+        try:
+            result = self.supabase.table('step_screenshots')\
+                .select('step_id')\
+                .eq('task_id', task_id)\
+                .execute()
+            return dict(Counter(row.get('step_id') for row in result.data or []))
+        except Exception as e:
+            logger.error(f"Error counting screenshots by step: {e}")
+            return {}
+
     def update_task_step_statistics(self, task_id: str, stats: Dict) -> bool:
         """更新任务步骤统计信息"""
         try:
@@ -1055,7 +1511,7 @@ class SupabaseTaskManager:
             }
             update_data.update(stats)
 
-            result = self.supabase.table('tasks')\
+            result = self.writer.table('tasks')\
                 .update(update_data)\
                 .eq('task_id', task_id)\
                 .execute()
@@ -1189,7 +1645,7 @@ class SupabaseTaskManager:
             logger.info(f"[LocalFile] 开始本地文件回退: 任务 {task_id[:8]}...")
 
             # 1. 扫描本地文件
-            scanner = LocalFileScanner()
+            scanner = get_local_file_scanner()
 
             # 检查扫描器是否启用
             if not scanner.is_enabled():
@@ -1353,13 +1809,13 @@ class SupabaseTaskManager:
             cutoff_date = datetime.now() - timedelta(days=days)
 
             # Delete old steps
-            steps_result = self.supabase.table('task_steps')\
+            steps_result = self.writer.table('task_steps')\
                 .delete()\
                 .lt('created_at', cutoff_date.isoformat())\
                 .execute()
 
             # Delete old screenshots
-            screenshots_result = self.supabase.table('step_screenshots')\
+            screenshots_result = self.writer.table('step_screenshots')\
                 .delete()\
                 .lt('created_at', cutoff_date.isoformat())\
                 .execute()
@@ -1452,13 +1908,13 @@ class SupabaseTaskManager:
         """Update screenshot URLs for a step"""
         try:
             # Update task_steps table
-            result1 = self.supabase.table('task_steps')\
+            result1 = self.writer.table('task_steps')\
                 .update({'screenshot_url': remote_url})\
                 .eq('step_id', step_id)\
                 .execute()
 
             # Update step_screenshots table
-            result2 = self.supabase.table('step_screenshots')\
+            result2 = self.writer.table('step_screenshots')\
                 .update({'remote_url': remote_url})\
                 .eq('screenshot_path', local_path)\
                 .execute()
@@ -1655,7 +2111,8 @@ class SupabaseTaskManager:
             return {}
 
 # 导出主要类
-__all__ = ['SupabaseTaskManager', 'GlobalTask']
+__all__ = ['SupabaseTaskManager', 'GlobalTask', 'StepWriter', 'get_supabase_client', 'get_step_writer',
+           'get_local_file_scanner']
 
 if __name__ == "__main__":
     # 测试代码